@@ -13,7 +13,7 @@
     'website': "https://www.inov.cm",
 
     'category': 'Invoices',
-    'version': '0.2',
+    'version': '0.6',
 
     # any module necessary for this one to work correctly
     'depends': ['base','account',
@@ -37,6 +37,8 @@
         'data/service_cron_data.xml',
         'wizard/debour_wizard_views.xml',
         'wizard/message_wizard_views.xml',
+        'wizard/folder_invoice_wizard_views.xml',
+        'wizard/package_import_wizard_views.xml',
         'security/inov_transit_security.xml',
         'security/ir.model.access.csv',
         'views/transit_menu_views.xml',  # Charger les menus AVANT alerte_data
@@ -51,9 +53,16 @@
         'views/inov_transit_report.xml',
         'views/simplify_report_templates.xml',
         'views/account_invoice_views.xml',
+        'views/invoice_print_views.xml',
+        'views/pdf_cache_views.xml',
+        'views/package_dwell_views.xml',
+        'views/folder_archive_views.xml',
+        'views/folder_bulk_views.xml',
+        'views/folder_outbox_views.xml',
         'views/res_partner_views.xml',
         'views/account_config_setting_view.xml',
         'views/analyse_folder_report_view.xml',
+        'views/task_checklist_report_views.xml',
     ],
     
     'assets': {
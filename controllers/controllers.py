@@ -1,22 +1,154 @@
 # -*- coding: utf-8 -*-
-# from odoo import http
 
+import gzip
+import hashlib
+import json
 
-# class TransitInvoice(http.Controller):
-#     @http.route('/inov_transit/inov_transit', auth='public')
-#     def index(self, **kw):
-#         return "Hello, world"
+from odoo import http, fields
+from odoo.tools import date_utils
+from odoo.http import request
 
-#     @http.route('/inov_transit/inov_transit/objects', auth='public')
-#     def list(self, **kw):
-#         return http.request.render('inov_transit.listing', {
-#             'root': '/inov_transit/inov_transit',
-#             'objects': http.request.env['inov_transit.inov_transit'].search([]),
-#         })
+# Champs exposes par l'API de suivi des dossiers et champs renvoyes par defaut
+FOLDER_API_FIELDS = {
+    'name', 'stages', 'stage_id', 'customer_id', 'date_arrival', 'alerte', 'checklist_progress',
+    'date_open', 'date_close', 'date_deadline', 'date_declaration', 'date_liquidation', 'date_quittance',
+    'date_bad', 'date_sortie', 'num_ot', 'num_brd', 'num_di', 'num_avi', 'num_besc', 'num_quittance',
+    'num_manifeste', 'num_liquidation', 'total_fcl20', 'total_fcl40', 'total_colis', 'write_date',
+}
+FOLDER_API_DEFAULT_FIELDS = ['name', 'stages', 'stage_id', 'customer_id', 'date_arrival', 'alerte',
+                             'checklist_progress', 'write_date']
+FOLDER_API_PAGE_SIZE = 100
+FOLDER_API_MAX_PAGE_SIZE = 1000
 
-#     @http.route('/inov_transit/inov_transit/objects/<model("inov_transit.inov_transit"):obj>', auth='public')
-#     def object(self, obj, **kw):
-#         return http.request.render('inov_transit.object', {
-#             'object': obj
-#         })
 
+class FolderApiError(Exception):
+    pass
+
+
+class TransitFolderApi(http.Controller):
+
+    def _int_param(self, params, key):
+        value = params.get(key)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise FolderApiError("Parametre %s invalide: entier attendu" % key)
+
+    def _date_param(self, params, key):
+        value = params.get(key)
+        if not value:
+            return None
+        try:
+            return fields.Date.to_date(value)
+        except ValueError:
+            raise FolderApiError("Parametre %s invalide: date AAAA-MM-JJ attendue" % key)
+
+    def _folder_domain(self, params):
+        """ Filtres de l'API: client, processus, etape, fenetre d'ETA et reference """
+        domain = []
+        customer_id = self._int_param(params, 'customer_id')
+        if customer_id:
+            domain.append(('customer_id', '=', customer_id))
+        process = params.get('process')
+        if process:
+            processes = process.split(',')
+            allowed = dict(request.env['folder.transit']._fields['stages'].selection)
+            if not all(value in allowed for value in processes):
+                raise FolderApiError("Parametre process invalide: valeurs possibles %s" % ', '.join(allowed))
+            domain.append(('stages', 'in', processes))
+        stage_id = self._int_param(params, 'stage_id')
+        if stage_id:
+            domain.append(('stage_id', '=', stage_id))
+        eta_from = self._date_param(params, 'eta_from')
+        if eta_from:
+            domain.append(('date_arrival', '>=', eta_from))
+        eta_to = self._date_param(params, 'eta_to')
+        if eta_to:
+            domain.append(('date_arrival', '<=', eta_to))
+        reference = (params.get('reference') or '').strip()
+        if reference:
+            domain.append(('any_reference', 'ilike', reference))
+        cursor = self._int_param(params, 'cursor')
+        if cursor:
+            domain.append(('id', '>', cursor))
+        return domain
+
+    def _folder_fields(self, params):
+        if not params.get('fields'):
+            return list(FOLDER_API_DEFAULT_FIELDS)
+        fnames = [fname.strip() for fname in params['fields'].split(',') if fname.strip()]
+        unknown = [fname for fname in fnames if fname not in FOLDER_API_FIELDS]
+        if unknown:
+            raise FolderApiError("Champs inconnus: %s" % ', '.join(unknown))
+        return fnames
+
+    @http.route('/inov_transit/api/folders', type='http', auth='user', methods=['GET'], csrf=False)
+    def folder_status(self, **params):
+        """ Etat des dossiers en JSON, pagine par curseur (id croissant).
+        Parametres: customer_id, process (transit,accone,ship), stage_id, eta_from, eta_to, reference,
+        fields (liste separee par des virgules), limit, cursor (valeur next_cursor de la page precedente).
+        La page est d'abord lue sur (id, write_date) et les many2one demandes, avec la date de modification
+        des enregistrements lies: si l'ETag correspond a If-None-Match, la reponse est un 304 vide sans
+        lecture des autres champs.
+        """
+        try:
+            domain = self._folder_domain(params)
+            fnames = self._folder_fields(params)
+            limit = self._int_param(params, 'limit') or FOLDER_API_PAGE_SIZE
+        except FolderApiError as e:
+            return request.make_json_response({'error': str(e)}, status=400)
+        limit = max(1, min(limit, FOLDER_API_MAX_PAGE_SIZE))
+
+        Folder = request.env['folder.transit']
+        relations = [fname for fname in fnames if Folder._fields[fname].type == 'many2one']
+        folders = Folder.search_fetch(domain, ['write_date'] + relations, limit=limit + 1, order='id')
+        next_cursor = None
+        if len(folders) > limit:
+            folders = folders[:limit]
+            next_cursor = str(folders[-1].id)
+
+        # Les libelles des many2one (client, etape) font partie de la reponse: leurs dates de
+        # modification entrent dans l'ETag, une requete par modele lie
+        related = []
+        for fname in relations:
+            records = folders[fname]
+            records.fetch(['write_date'])
+            related.append(sorted((record.id, record.write_date) for record in records))
+
+        signature = repr((
+            request.env.uid, request.env.lang, fnames, next_cursor,
+            [(folder.id, folder.write_date) for folder in folders], related,
+        ))
+        etag = 'W/"%s"' % hashlib.sha1(signature.encode()).hexdigest()
+        headers = [('ETag', etag), ('Cache-Control', 'private, no-cache')]
+        if_none_match = request.httprequest.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return request.make_response('', headers=headers, status=304)
+
+        return request.make_json_response({
+            'data': folders.read(fnames),
+            'next_cursor': next_cursor,
+        }, headers=headers)
+
+    @http.route('/inov_transit/api/sync', type='http', auth='user', methods=['GET', 'POST'], csrf=False)
+    def folder_sync(self, since=None, known=None, **params):
+        """ Synchronisation differentielle du client mobile des agents.
+        Parametres: since (filigrane renvoye par l'appel precedent, absent pour une synchronisation complete),
+        known (ids des dossiers deja presents sur le client, separes par des virgules).
+        La reponse JSON est compressee en gzip quand le client l'accepte.
+        """
+        try:
+            since = fields.Datetime.to_datetime(since) if since else None
+            known_ids = [int(folder_id) for folder_id in (known or '').split(',') if folder_id.strip()]
+        except ValueError:
+            return request.make_json_response({'error': "Parametres since ou known invalides"}, status=400)
+
+        result = request.env['folder.transit']._sync_changes(since=since, known_ids=known_ids)
+        body = json.dumps(result, separators=(',', ':'), default=date_utils.json_default).encode()
+        headers = [('Content-Type', 'application/json'), ('Cache-Control', 'no-store'), ('Vary', 'Accept-Encoding')]
+        if 'gzip' in request.httprequest.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            headers.append(('Content-Encoding', 'gzip'))
+        return request.make_response(body, headers=headers)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """ Rattache les lignes de check list existantes a leur type d'activite et a leur responsable,
+    et corrige la duree en heures (toujours nulle auparavant) a partir des dates """
+    if not version:
+        return
+    cr.execute("""
+        UPDATE task_checklist c
+           SET activity_type_id = t.id
+          FROM mail_activity_type t
+         WHERE c.activity_type_id IS NULL
+           AND t.name->>'en_US' = c.name
+    """)
+    cr.execute("""
+        UPDATE task_checklist c
+           SET user_id = u.id
+          FROM res_users u
+          JOIN res_partner p ON p.id = u.partner_id
+         WHERE c.user_id IS NULL
+           AND p.name = c.responsible_id
+    """)
+    cr.execute("""
+        UPDATE task_checklist
+           SET time_spent_float = (date_dealine - date_start) * 24.0
+         WHERE datetime_start IS NULL
+           AND date_start IS NOT NULL
+           AND date_dealine IS NOT NULL
+    """)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """ Cree et remplit en SQL la colonne model_transit_id des activites, pour eviter le calcul
+    Python sur toutes les activites a la mise a jour """
+    if not version:
+        return
+    cr.execute("ALTER TABLE mail_activity ADD COLUMN IF NOT EXISTS model_transit_id INTEGER")
+    cr.execute("""
+        UPDATE mail_activity a
+           SET model_transit_id = f.id
+          FROM folder_transit f
+         WHERE a.res_model = 'folder.transit'
+           AND f.id = a.res_id
+           AND a.model_transit_id IS NULL
+    """)
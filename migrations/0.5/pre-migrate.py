@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """ Prepare les index trigrammes des references de dossier: extension pg_trgm et suppression de
+    l'ancien index btree du numero de dossier, recree en GIN par l'ORM """
+    if not version:
+        return
+    try:
+        with cr.savepoint():
+            cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception:
+        _logger.warning("Extension pg_trgm non installee: les references seront indexees en btree")
+    cr.execute("DROP INDEX IF EXISTS folder_transit__name_index")
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """ Marque les taches realisees a la creation des dossiers (debut et fin confondus) pour les exclure
+    du rapport des durees, puis rafraichit la vue materialisee du rapport """
+    if not version:
+        return
+    cr.execute("""
+        UPDATE task_checklist
+           SET is_auto = TRUE
+         WHERE datetime_start IS NOT NULL
+           AND datetime_done IS NOT NULL
+           AND datetime_done - datetime_start < INTERVAL '5 seconds'
+    """)
+    cr.execute("REFRESH MATERIALIZED VIEW task_checklist_duration_report")
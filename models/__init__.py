@@ -3,9 +3,19 @@
 from . import models
 from . import account
 from . import account_config_setting
+from . import attachment
 from . import conversion
 from . import debour
 from . import folder
+from . import folder_archive
+from . import folder_bulk
+from . import folder_outbox
+from . import invoice_print
+from . import iso6346
+from . import package_dwell
+from . import pdf_cache
 from . import prestation
+from . import report_invoice
 from . import stock_incoterm
-from . import task_check_list
\ No newline at end of file
+from . import task_check_list
+from . import transit_sync
\ No newline at end of file
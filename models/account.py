@@ -1,8 +1,10 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from . import conversion
 from odoo.exceptions import UserError
 from odoo.tools import email_re, email_split, email_escape_char, float_is_zero, float_compare, \
-    pycompat, date_utils
+    pycompat, date_utils, split_every
 
 MAP_INVOICE_TYPE_PARTNER_TYPE = {
     'out_invoice': 'customer',
@@ -11,41 +13,69 @@ MAP_INVOICE_TYPE_PARTNER_TYPE = {
     'in_refund': 'supplier',
 }
 
+TRANSIT_INVOICE_REPORTS = {
+    'simple': 'inov_transit.account_invoice_folder_simple_id',
+    'sorepco': 'inov_transit.account_invoices_folder_transit_sorepco',
+    'placam': 'inov_transit.account_invoices_folder_transit_placam',
+    'cimaf': 'inov_transit.account_invoices_folder_transit_cimaf',
+}
+
 
 class TransitAccountInvoice(models.Model):
     _inherit = 'account.move'
 
 
     @api.depends('amount_total')
-    def get_amount_letter(self):
-        currency = "FCFA"
-        amount = conversion.trad(self.amount_total, currency)
-        return amount
+    def get_amount_letter(self, amount_letters=None):
+        if amount_letters and self.id in amount_letters:
+            return amount_letters[self.id]
+        return conversion.amount_to_words(self.amount_total)
 
+    def _get_amount_letters(self):
+        """ Montants en lettres de toutes les factures en une passe (impressions groupees) """
+        return dict(zip(self.ids, conversion.batch_amount_to_words(self.mapped('amount_total'))))
 
-    @api.depends('invoice_line_ids')
-    def get_invoice_line_changed(self):
+
+    def _get_invoice_line_partitions(self):
+        """ Repartit en une seule passe les lignes de toutes les factures entre lignes de prestation
+        et autres lignes
+        :return {invoice_id: (ids des lignes de prestation, ids des autres lignes)}
+        """
         prestation = self.env['prestation.transit']
-        invoices_change = []
-        invoices = []
-        for line in self.invoice_line_ids:
-            if prestation.search([('product_id', '=', line.product_id.id)]):
-                invoices_change.append(line)
-            else:
-                invoices.append(line)
-        return invoices_change, invoices
+        partitions = {}
+        for invoice in self:
+            invoices_change = []
+            invoices = []
+            for line in invoice.invoice_line_ids:
+                if prestation._is_prestation_product(line.product_id.id):
+                    invoices_change.append(line.id)
+                else:
+                    invoices.append(line.id)
+            partitions[invoice.id] = (invoices_change, invoices)
+        return partitions
+
+    @api.depends('invoice_line_ids')
+    def get_invoice_line_changed(self, line_partitions=None):
+        """ Lignes de prestation et autres lignes de la facture, lues dans line_partitions
+        (precalcule pour tout le rapport) lorsqu'il est fourni """
+        if not line_partitions or self.id not in line_partitions:
+            line_partitions = self._get_invoice_line_partitions()
+        invoices_change, invoices = line_partitions[self.id]
+        lines = self.env['account.move.line']
+        return lines.browse(invoices_change), lines.browse(invoices)
 
     @api.depends('service_ids.amount_debour', 'invoice_line_ids.price_total')
     def _compute_amount_transit(self):
+        saved = self.filtered('id')
+        if saved:
+            saved._compute_amount_transit_batch()
         prestation = self.env['prestation.transit']
-        for transit in self:
+        for transit in self - saved:
             amount_debour = amount_folder = amount_variable = 0.0
             for line in transit.service_ids:
                 amount_debour += line.amount_debour
             for folder in transit.invoice_line_ids:
-                if prestation.search([('product_id', '=', folder.product_id.id)]):
-                    amount_variable += folder.price_total
-                elif prestation.search([('product_id', '=', folder.product_id.id), ('type_service', '=', 'fixed')]):
+                if prestation._is_prestation_product(folder.product_id.id):
                     amount_variable += folder.price_total
                 else:
                     amount_folder += folder.price_total
@@ -55,12 +85,50 @@ class TransitAccountInvoice(models.Model):
                 'amount_transit_expense_variable': transit.currency_id.round(amount_variable),
             })
 
+    def _compute_amount_transit_batch(self):
+        """ Calcule les totaux debours / charges fixes / charges variables de toutes les factures
+        a partir d'agregats groupes sur les debours et les lignes de facture """
+        prestation = self.env['prestation.transit']
+        amount_debour = defaultdict(float)
+        amount_folder = defaultdict(float)
+        amount_variable = defaultdict(float)
+        for invoice, amount in self.env['debour.transit']._read_group(
+                [('invoice_ids', 'in', self.ids)], ['invoice_ids'], ['amount_debour:sum']):
+            amount_debour[invoice.id] += amount
+        for invoice, product, amount in self.env['account.move.line']._read_group(
+                [('move_id', 'in', self.ids), ('display_type', 'in', ('product', 'line_section', 'line_note'))],
+                ['move_id', 'product_id'], ['price_total:sum']):
+            if prestation._is_prestation_product(product.id):
+                amount_variable[invoice.id] += amount
+            else:
+                amount_folder[invoice.id] += amount
+        invoices_by_currency = defaultdict(list)
+        for transit in self:
+            invoices_by_currency[transit.currency_id].append(transit)
+        for currency, invoices in invoices_by_currency.items():
+            for transit in invoices:
+                transit.update({
+                    'amount_transit_debours': currency.round(amount_debour[transit.id]),
+                    'amount_transit_expense': currency.round(amount_folder[transit.id]),
+                    'amount_transit_expense_variable': currency.round(amount_variable[transit.id]),
+                })
+
+    def action_recompute_amount_transit(self):
+        """ Recalcul en masse des totaux transit (ex. apres un changement de taxe ou de prestation) """
+        fnames = ['amount_transit_debours', 'amount_transit_expense', 'amount_transit_expense_variable']
+        for invoices in split_every(1000, self.ids, self.browse):
+            for fname in fnames:
+                self.env.add_to_compute(self._fields[fname], invoices)
+            invoices.flush_recordset(fnames)
+        return True
+
     sent = fields.Boolean(string='Sent', default=False) #je viens d'ajouter cette ligne pour installer le champ sent dans le model account.move
 
     transit_id = fields.Many2one('folder.transit', string='Dossier')
     date_op = fields.Date(string='Date Operation')
     number_d = fields.Char(string='Numero')
-    service_ids = fields.Many2many('debour.transit')
+    service_ids = fields.Many2many('debour.transit', 'account_move_debour_transit_rel',
+                                   'account_move_id', 'debour_transit_id')
     folder_type = fields.Selection([('transit', 'Dedouanement'), ('accone', 'Acconage'), ('ship', 'Shipping')],
                                    string="Processus")
     amount_transit_debours = fields.Monetary("Debours", compute='_compute_amount_transit', currency_field='currency_id',
@@ -72,20 +140,28 @@ class TransitAccountInvoice(models.Model):
                                                       tracking=True)
 
 
+    def _get_transit_report_xmlid(self):
+        """ Rapport de facture a utiliser selon le regime du client """
+        self.ensure_one()
+        if self.user_has_groups('account.group_account_invoice'):
+            return TRANSIT_INVOICE_REPORTS.get(self.partner_id.regime_type, 'account.account_invoices')
+        return 'account.account_invoices'
+
     def invoice_print(self):
         """ Print the invoice and mark it as sent, so that we can see more
             easily the next step of the workflow
         """
+        reports = {invoice._get_transit_report_xmlid() for invoice in self}
+        if len(reports) > 1:
+            # Selection multi-regime: chaque facture est imprimee avec son propre rapport
+            return self.action_bulk_print()
         self.filtered(lambda inv: not inv.sent).write({'sent': True})
-        if self.user_has_groups('account.group_account_invoice') and self.partner_id.regime_type == 'simple':
-            return self.env.ref('inov_transit.account_invoice_folder_simple_id').report_action(self)
-        if self.user_has_groups('account.group_account_invoice') and self.partner_id.regime_type == 'sorepco':
-            return self.env.ref('inov_transit.account_invoices_folder_transit_sorepco').report_action(self)
-        if self.user_has_groups('account.group_account_invoice') and self.partner_id.regime_type == 'placam':
-            return self.env.ref('inov_transit.account_invoices_folder_transit_placam').report_action(self)
-        if self.user_has_groups('account.group_account_invoice') and self.partner_id.regime_type == 'cimaf':
-            return self.env.ref('inov_transit.account_invoices_folder_transit_cimaf').report_action(self)
-        return self.env.ref('account.account_invoices').report_action(self)
+        return self.env.ref(reports.pop() if reports else 'account.account_invoices').report_action(self)
+
+    def action_bulk_print(self, output_format='pdf'):
+        """ Lance l'impression groupee en arriere-plan et ouvre le suivi du travail """
+        job = self.env['transit.invoice.print'].create_from_invoices(self, output_format=output_format)
+        return job.action_view_job()
 
 
     # @api.depends('invoice_line_ids.price_subtotal', 'tax_ids.amount', 'tax_ids.amount_rounding',
@@ -156,16 +232,14 @@ class TransitAccountInvoice(models.Model):
         Prestation_obj = self.env['prestation.transit']
 
         for line in self.invoice_line_ids:
-            product_fixed = Prestation_obj.search(
-                [('product_id', '=', line.product_id.id), ('type_service', '=', 'fixed')])
-            product_changed = Prestation_obj.search(
-                [('product_id', '=', line.product_id.id), ('type_service', '=', 'changed')])
+            product_fixed = Prestation_obj._get_product_prestation(line.product_id.id, 'fixed')
+            product_changed = Prestation_obj._get_product_prestation(line.product_id.id, 'changed')
             if not line.account_id:
                 continue
             if product_fixed:
-                quantity = (product_fixed.taux / 100.0) * line.quantity + line.caution
+                quantity = (product_fixed['taux'] / 100.0) * line.quantity + line.caution
             elif product_changed:
-                quantity = (product_changed.taux / 100.0) * line.quantity + line.caution
+                quantity = (product_changed['taux'] / 100.0) * line.quantity + line.caution
             else:
                 quantity = line.quantity
 
@@ -317,71 +391,25 @@ class TransitExpense(models.Model):
     @api.onchange('product_id')
     def _onchange_price_unit(self):
         Prestation_obj = self.env['prestation.transit']
-        product_fixed = Prestation_obj.search([('product_id', '=', self.product_id.id), ('type_service', '=', 'fixed')])
-        product_changed = Prestation_obj.search(
-            [('product_id', '=', self.product_id.id), ('type_service', '=', 'changed')])
+        product_fixed = Prestation_obj._get_product_prestation(self.product_id.id, 'fixed')
+        product_changed = Prestation_obj._get_product_prestation(self.product_id.id, 'changed')
         if product_fixed:
-            self.caution = product_fixed.caution
+            self.caution = product_fixed['caution']
         if product_changed:
-            self.caution = product_changed.caution
+            self.caution = product_changed['caution']
 
 
     @api.depends('product_id')
     def _get_tarif(self):
         Prestation_obj = self.env['prestation.transit']
-        product_fixed = Prestation_obj.search([('product_id', '=', self.product_id.id), ('type_service', '=', 'fixed')])
-        product_changed = Prestation_obj.search(
-            [('product_id', '=', self.product_id.id), ('type_service', '=', 'changed')])
-        if product_fixed:
-            self.Tarif = str(product_fixed.taux) + "%"
-        if product_changed:
-            self.Tarif = str(product_changed.caution) + "+" + str(product_changed.taux)
-
-
-    @api.depends('price_unit', 'discount', 'invoice_line_tax_ids', 'quantity',
-                 'product_id', 'invoice_id.partner_id', 'invoice_id.currency_id', 'invoice_id.company_id',
-                 'invoice_id.date_invoice', 'invoice_id.date', 'caution')
-    def _compute_price(self):
-        quantity = 0.0
-        currency = self.invoice_id and self.invoice_id.currency_id or None
-        Prestation_obj = self.env['prestation.transit']
-        product_fixed = Prestation_obj.search([('product_id', '=', self.product_id.id), ('type_service', '=', 'fixed')])
-        product_changed = Prestation_obj.search(
-            [('product_id', '=', self.product_id.id), ('type_service', '=', 'changed')])
-        if product_fixed:
-            quantity = (product_fixed.taux / 100.0) * self.quantity + self.caution
-        elif product_changed:
-            quantity = (product_changed.taux / 100.0) * self.quantity + self.caution
-
-        else:
-            quantity = self.quantity
-
-        price = self.price_unit * (1 - (self.discount or 0.0) / 100.0)
-
-        taxes = False
-        if self.invoice_line_tax_ids:
-            taxes = self.invoice_line_tax_ids.compute_all(price, currency, quantity, product=self.product_id,
-                                                          partner=self.invoice_id.partner_id)
-        # if product_fixed:
-        #     self.price_subtotal = price_subtotal_signed =  ((self.quantity * price) + self.caution) * (1 - (self.discount or 0.0) / 100.0)
-        #     taxes=product_fixed.product_id.taxes_id
-        #     self.price_total = sum(self.price_subtotal*(1 + (t.amount/100)) for t in taxes) if taxes else self.price_subtotal
-        # elif product_changed:
-        #     self.price_subtotal = price_subtotal_signed =  (self.quantity * price + self.caution)* (1 - (self.discount or 0.0) / 100.0)
-        #     taxes=product_changed.product_id.taxes_id
-        #     self.price_total = sum(self.price_subtotal*(1 + (t.amount/100)) for t in taxes) if taxes else self.price_subtotal
-        # else:
-        self.price_subtotal = price_subtotal_signed = taxes['total_excluded'] if taxes else quantity * price
-        self.price_total = taxes['total_included'] if taxes else self.price_subtotal
-
-        if self.invoice_id.currency_id and self.invoice_id.currency_id != self.invoice_id.company_id.currency_id:
-            currency = self.invoice_id.currency_id
-            date = self.invoice_id._get_currency_rate_date()
-            price_subtotal_signed = currency._convert(price_subtotal_signed, self.invoice_id.company_id.currency_id,
-                                                      self.company_id or self.env.user.company_id,
-                                                      date or fields.Date.today())
-        sign = self.invoice_id.type in ['in_refund', 'out_refund'] and -1 or 1
-        self.price_subtotal_signed = price_subtotal_signed * sign
+        for line in self:
+            line.Tarif = False
+            product_fixed = Prestation_obj._get_product_prestation(line.product_id.id, 'fixed')
+            product_changed = Prestation_obj._get_product_prestation(line.product_id.id, 'changed')
+            if product_fixed:
+                line.Tarif = str(product_fixed['taux']) + "%"
+            if product_changed:
+                line.Tarif = str(product_changed['caution']) + "+" + str(product_changed['taux'])
 
 
 class TransitAccountPayment(models.Model):
@@ -447,40 +475,46 @@ class TransitAccountPayment(models.Model):
 
 
     def post(self):
-        for invoice in self.invoice_ids.filtered(lambda ml: ml.state == 'paid'):
-            if invoice.transit_id.number >= 105 and invoice.transit_id.stages == 'transit':
-                transit = invoice.transit_id
-                search_domain = [('number', '=', 106)]
-                nws_stage = transit._stage_find(search_domain)
-                values = transit._onchange_stage_id_values(nws_stage.id)
-                transit.write({'stage_id': nws_stage.id})
-                transit.update(values)
-                invoice.update({
-                    'folder_type': invoice.transit_id.stages
-                })
-            elif invoice.transit_id.stages == 'ship':
-                number = invoice.transit_id.number
-                folder = invoice.transit_id
-                search_domain = [('number', '=', number)]
-                nws_stage = folder._stage_find(search_domain)
-                values = folder._onchange_stage_id_values(nws_stage.id)
-                transit.write({'stage_id': nws_stage.id})
-                transit.update(values)
-                invoice.update({
-                    'folder_type': invoice.transit_id.stages
-                })
-            elif invoice.transit_id.stages == 'accone':
-                number = invoice.transit_id.number
-                folder = invoice.transit_id
-                search_domain = [('number', '=', number)]
-                nws_stage = folder._stage_find(search_domain)
-                values = folder._onchange_stage_id_values(nws_stage.id)
-                transit.write({'stage_id': nws_stage.id})
-                transit.update(values)
-                invoice.update({
-                    'folder_type': invoice.transit_id.stages
-                })
+        """ Met a jour en une fois les dossiers des factures payees: les etapes cibles sont resolues
+        en une seule recherche puis les dossiers sont ecrits par etape cible """
+        invoices = self.invoice_ids.filtered(lambda ml: ml.state == 'paid')
+        folder_numbers = {}
+        for invoice in invoices:
+            folder = invoice.transit_id
+            if folder.stages == 'transit' and folder.number >= 105:
+                folder_numbers[folder] = 106
+            elif folder.stages in ('ship', 'accone'):
+                folder_numbers[folder] = folder.number
             else:
                 raise UserError("Le Dossier doit etre a l'etat Valide pour")
 
+        if folder_numbers:
+            stages_by_number = defaultdict(list)
+            for stage in self.env['stages.transit'].search([('number', 'in', list(set(folder_numbers.values())))]):
+                stages_by_number[stage.number].append(stage)
+            folders_by_stage = defaultdict(list)
+            for folder, number in folder_numbers.items():
+                candidates = stages_by_number.get(number)
+                if not candidates:
+                    continue
+                # Etape du meme processus que le dossier si plusieurs etapes portent ce numero
+                stage = next((st for st in candidates if st.stages == folder.stages), candidates[0])
+                folders_by_stage[stage].append(folder.id)
+            # Changements d'etape en masse: un message de synthese par dossier (voir bulk_update)
+            Folder = self.env['folder.transit'].with_context(transit_bulk_tracking='folder')
+            for stage, folder_ids in folders_by_stage.items():
+                folders = Folder.browse(folder_ids)
+                if stage.number:
+                    folders.write({'stage_id': stage.id, 'number': stage.number})
+                    continue
+                for folder in folders:
+                    values = folder._onchange_stage_id_values(stage.id)
+                    folder.write(dict(values, stage_id=stage.id))
+
+            invoices_by_process = defaultdict(list)
+            for invoice in invoices:
+                invoices_by_process[invoice.transit_id.stages].append(invoice.id)
+            for process, invoice_ids in invoices_by_process.items():
+                self.env['account.move'].browse(invoice_ids).write({'folder_type': process})
+
         return super(TransitAccountPayment, self).post()
\ No newline at end of file
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Champs many2many vers ir.attachment sur lesquels les pieces jointes sont dedoublonnees
+TRANSIT_ATTACHMENT_FIELDS = [
+    ('folder.transit', 'attachment_files'),
+    ('debour.transit', 'attach_files_ids'),
+]
+
+
+class IrAttachmentTransit(models.Model):
+    _inherit = 'ir.attachment'
+
+    def _transit_relations(self):
+        """ Tables de relation (table, colonne enregistrement, colonne piece jointe) des champs dedoublonnes """
+        relations = []
+        for model_name, field_name in TRANSIT_ATTACHMENT_FIELDS:
+            field = self.env[model_name]._fields[field_name]
+            relations.append((field.relation, field.column1, field.column2))
+        return relations
+
+    @api.model
+    def _transit_canonical_map(self, attachments):
+        """ Associe chaque piece jointe a la plus ancienne piece jointe de meme contenu
+        :return dict {id doublon: id canonique}
+        """
+        checksums = tuple(set(attachments.filtered('checksum').mapped('checksum')))
+        if not checksums:
+            return {}
+        self.flush_model(['checksum', 'type', 'res_model', 'res_field'])
+        self.env.cr.execute("""
+            SELECT checksum, MIN(id)
+              FROM ir_attachment
+             WHERE checksum IN %s
+               AND type = 'binary'
+               AND res_field IS NULL
+               AND res_model IN %s
+          GROUP BY checksum
+        """, [checksums, tuple(model_name for model_name, _field in TRANSIT_ATTACHMENT_FIELDS)])
+        canonical = dict(self.env.cr.fetchall())
+        return {
+            attachment.id: canonical[attachment.checksum]
+            for attachment in attachments
+            if canonical.get(attachment.checksum, attachment.id) != attachment.id
+        }
+
+    @api.model
+    def _transit_unreferenced(self, canonical_map):
+        """ Filtre les doublons dont les liens ont ete reportes sur la piece jointe canonique: plus lies
+        a aucun dossier, debours ou message, et dont l'enregistrement proprietaire (res_model / res_id)
+        n'existe plus ou est un dossier / debours qui reference desormais la piece jointe canonique.
+        Une piece jointe deposee dans le chatter n'a pas de ligne de relation mais reste attachee a son document.
+        :param canonical_map: dict {id doublon: id canonique}
+        """
+        if not canonical_map:
+            return self.browse()
+        self.env.flush_all()
+        relations = self._transit_relations()
+        query = "SELECT id, res_model, res_id FROM ir_attachment a WHERE a.id IN %s"
+        for table, _column1, column2 in relations + [('message_attachment_rel', 'message_id', 'attachment_id')]:
+            query += " AND NOT EXISTS (SELECT 1 FROM {table} r WHERE r.{column} = a.id)".format(
+                table=table, column=column2)
+        self.env.cr.execute(query, [tuple(canonical_map)])
+        unlinked, owned = [], {}
+        for attachment_id, res_model, res_id in self.env.cr.fetchall():
+            if res_model and res_id and res_model in self.env:
+                owned.setdefault(res_model, []).append((attachment_id, res_id))
+            else:
+                unlinked.append(attachment_id)
+        transit_relations = {model_name: relation for (model_name, _field), relation
+                             in zip(TRANSIT_ATTACHMENT_FIELDS, relations)}
+        for res_model, pairs in owned.items():
+            live = set(self.env[res_model].sudo().browse([res_id for _id, res_id in pairs]).exists().ids)
+            unlinked += [attachment_id for attachment_id, res_id in pairs if res_id not in live]
+            pairs = [(attachment_id, res_id) for attachment_id, res_id in pairs if res_id in live]
+            if res_model not in transit_relations or not pairs:
+                continue
+            # Dossier ou debours proprietaire: le doublon peut partir des que son many2many pointe la canonique
+            table, column1, column2 = transit_relations[res_model]
+            self.env.cr.execute("SELECT {column1}, {column2} FROM {table} WHERE ({column1}, {column2}) IN %s".format(
+                table=table, column1=column1, column2=column2),
+                [tuple((res_id, canonical_map[attachment_id]) for attachment_id, res_id in pairs)])
+            rehomed = set(self.env.cr.fetchall())
+            unlinked += [attachment_id for attachment_id, res_id in pairs
+                         if (res_id, canonical_map[attachment_id]) in rehomed]
+        return self.browse(unlinked)
+
+    @api.model
+    def _transit_unlink_duplicates(self, duplicates):
+        """ Supprime les doublons et renvoie les octets reellement liberes: le stockage est adresse par
+        checksum, un fichier encore utilise par une autre piece jointe (la canonique) n'est pas libere
+        """
+        sizes = {attachment.store_fname: attachment.file_size for attachment in duplicates if attachment.store_fname}
+        freed = sum(attachment.file_size for attachment in duplicates if not attachment.store_fname)
+        duplicates.unlink()
+        if sizes:
+            self.env.cr.execute("SELECT DISTINCT store_fname FROM ir_attachment WHERE store_fname IN %s",
+                                [tuple(sizes)])
+            shared = {row[0] for row in self.env.cr.fetchall()}
+            freed += sum(size for store_fname, size in sizes.items() if store_fname not in shared)
+        return freed
+
+    @api.model
+    def _transit_rehome(self, model_name, res_ids):
+        """ Avant la suppression de res_ids, transfere les pieces jointes qu'ils possedent et qui sont
+        encore liees a un autre dossier ou debours (piece jointe canonique partagee apres dedoublonnage)
+        a l'un de ces enregistrements: la suppression en cascade de BaseModel.unlink les epargne ainsi.
+        """
+        if not res_ids:
+            return
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT id FROM ir_attachment
+             WHERE res_model = %s AND res_id IN %s AND res_field IS NULL
+        """, [model_name, tuple(res_ids)])
+        owned = [row[0] for row in self.env.cr.fetchall()]
+        if not owned:
+            return
+        new_owners = {}
+        for (rel_model, _fname), (table, column1, column2) in zip(TRANSIT_ATTACHMENT_FIELDS, self._transit_relations()):
+            pending = [attachment_id for attachment_id in owned if attachment_id not in new_owners]
+            if not pending:
+                break
+            excluded = tuple(res_ids) if rel_model == model_name else (0,)
+            self.env.cr.execute("""
+                SELECT {column2}, MIN({column1})
+                  FROM {table}
+                 WHERE {column2} IN %s AND {column1} NOT IN %s
+              GROUP BY {column2}
+            """.format(table=table, column1=column1, column2=column2), [tuple(pending), excluded])
+            for attachment_id, res_id in self.env.cr.fetchall():
+                new_owners[attachment_id] = (rel_model, res_id)
+        by_owner = {}
+        for attachment_id, owner in new_owners.items():
+            by_owner.setdefault(owner, []).append(attachment_id)
+        for (rel_model, res_id), attachment_ids in by_owner.items():
+            self.sudo().browse(attachment_ids).write({'res_model': rel_model, 'res_id': res_id})
+
+    @api.model
+    def merge_transit_duplicates(self, batch_size=500, max_batches=None):
+        """ Fusionne par lots les pieces jointes identiques (meme checksum) des dossiers et debours.
+        Les liens sont reportes sur la piece jointe la plus ancienne, les doublons devenus
+        orphelins sont supprimes.
+        :return dict avec le nombre de groupes traites, de doublons supprimes et d'octets de stockage
+                liberes (fichiers qui ne sont plus utilises par aucune piece jointe)
+        """
+        result = {'groups': 0, 'removed': 0, 'reclaimed_bytes': 0}
+        relations = self._transit_relations()
+        model_names = tuple(model_name for model_name, _field in TRANSIT_ATTACHMENT_FIELDS)
+        last_checksum = ''
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            self.env.flush_all()
+            self.env.cr.execute("""
+                SELECT checksum, MIN(id), ARRAY_AGG(id ORDER BY id)
+                  FROM ir_attachment
+                 WHERE checksum > %s
+                   AND type = 'binary'
+                   AND res_field IS NULL
+                   AND res_model IN %s
+              GROUP BY checksum
+                HAVING COUNT(*) > 1
+              ORDER BY checksum
+                 LIMIT %s
+            """, [last_checksum, model_names, batch_size])
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            batches += 1
+            last_checksum = rows[-1][0]
+            duplicates, canonicals = [], []
+            for _checksum, canonical_id, ids in rows:
+                for attachment_id in ids[1:]:
+                    duplicates.append(attachment_id)
+                    canonicals.append(canonical_id)
+            for table, column1, column2 in relations:
+                self.env.cr.execute("""
+                    WITH m AS (SELECT UNNEST(%s::int[]) AS dup, UNNEST(%s::int[]) AS canon)
+                    INSERT INTO {table} ({column1}, {column2})
+                    SELECT DISTINCT r.{column1}, m.canon FROM {table} r JOIN m ON r.{column2} = m.dup
+                    ON CONFLICT DO NOTHING
+                """.format(table=table, column1=column1, column2=column2), [duplicates, canonicals])
+                self.env.cr.execute("DELETE FROM {table} WHERE {column2} = ANY(%s)".format(
+                    table=table, column2=column2), [duplicates])
+            self.env.invalidate_all()
+            orphans = self.sudo()._transit_unreferenced(dict(zip(duplicates, canonicals)))
+            result['groups'] += len(rows)
+            result['removed'] += len(orphans)
+            result['reclaimed_bytes'] += self.sudo()._transit_unlink_duplicates(orphans)
+        _logger.info("Dedoublonnage des pieces jointes transit: %(groups)s groupe(s), %(removed)s doublon(s) "
+                     "supprime(s), %(reclaimed_bytes)s octet(s) de stockage libere(s)", result)
+        return result
+
+    @api.model
+    def _cron_merge_transit_duplicates(self):
+        return self.merge_transit_duplicates()
+
+
+class TransitAttachmentMixin(models.AbstractModel):
+    _name = 'transit.attachment.mixin'
+    _description = 'Dedoublonnage des pieces jointes transit'
+
+    # Noms des champs many2many vers ir.attachment a dedoublonner
+    _transit_attachment_fields = ()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(TransitAttachmentMixin, self).create(vals_list)
+        fnames = [fname for fname in self._transit_attachment_fields if any(fname in vals for vals in vals_list)]
+        if fnames:
+            records._dedup_transit_attachments(fnames)
+        return records
+
+    def write(self, vals):
+        result = super(TransitAttachmentMixin, self).write(vals)
+        fnames = [fname for fname in self._transit_attachment_fields if fname in vals]
+        if fnames and not self.env.context.get('transit_attachment_dedup_done'):
+            self._dedup_transit_attachments(fnames)
+        return result
+
+    def unlink(self):
+        self.env['ir.attachment'].sudo()._transit_rehome(self._name, self.ids)
+        return super(TransitAttachmentMixin, self).unlink()
+
+    def _dedup_transit_attachments(self, field_names):
+        """ Remplace les pieces jointes dont le contenu existe deja par la piece jointe existante """
+        Attachment = self.env['ir.attachment'].sudo()
+        records = self.with_context(transit_attachment_dedup_done=True)
+        duplicates = {}
+        for fname in field_names:
+            mapping = Attachment._transit_canonical_map(records.sudo().mapped(fname))
+            if not mapping:
+                continue
+            for record in records:
+                dup_ids = [attachment_id for attachment_id in record.sudo()[fname].ids if attachment_id in mapping]
+                if dup_ids:
+                    record.write({fname: [(3, attachment_id) for attachment_id in dup_ids]
+                                  + [(4, mapping[attachment_id]) for attachment_id in dup_ids]})
+                    duplicates.update((attachment_id, mapping[attachment_id]) for attachment_id in dup_ids)
+        if duplicates:
+            Attachment._transit_unreferenced(duplicates).unlink()
@@ -5,31 +5,54 @@ from odoo import models, fields, api
 
 class TransitDebour(models.Model):
     _name = 'debour.transit'
+    _inherit = ['transit.attachment.mixin']
     _rec_name = 'product_id'
+    _transit_attachment_fields = ('attach_files_ids',)
 
 
-    @api.depends('product_id', 'product_qty', 'tax_id', 'transit_id')
+    @api.depends('product_id', 'product_id.lst_price', 'product_qty', 'tax_id', 'tax_id.amount',
+                 'tax_id.amount_type', 'tax_id.price_include', 'transit_id', 'transit_id.currency_id',
+                 'transit_id.customer_id')
     def _compute_taxe_line(self):
+        """ Regroupe les lignes par (taxes, devise, client, produit, prix, quantite)
+        afin de n'appeler compute_all qu'une seule fois par combinaison """
+        groups = {}
         for line in self:
+            folder = line.transit_id
+            key = (tuple(sorted(line.tax_id.ids)), folder.currency_id.id, folder.customer_id.id,
+                   line.product_id.id, line.product_id.lst_price, line.product_qty)
+            groups.setdefault(key, []).append(line.id)
+        for key, line_ids in groups.items():
+            lines = self.browse(line_ids)
+            line = lines[0]
             taxes = line.tax_id.compute_all(line.product_id.lst_price, line.transit_id.currency_id, line.product_qty,
                                             product=line.product_id, partner=line.transit_id.customer_id)
-            line.update({
+            lines.update({
                 'price_taxed': sum(t.get('amount', 0.0) for t in taxes.get('taxes', [])),
                 'amount_debour': taxes['total_included'],
             })
             # line.price_taxed= round(sum((line.product_qty*t.amount)/100 for t in line.product_id.taxes_id))
             # line.amount_debour= line.price_taxed + line.product_qty
 
+    @api.depends('invoice_ids', 'invoice_ids.state')
+    def _compute_billing_state(self):
+        for line in self:
+            if line.invoice_ids.filtered(lambda inv: inv.state != 'cancel'):
+                line.billing_state = 'billed'
+            else:
+                line.billing_state = 'unbilled'
+
     product_id = fields.Many2one(
         'product.product',
         string='Designation',
         required=True,
         domain="[('sale_ok', '=', True),('type','=','service')]")
     ref_deb = fields.Char("Reference Facture")
-    amount_debour = fields.Float("Montant", compute='_compute_taxe_line', readonly=True)
+    amount_debour = fields.Float("Montant", compute='_compute_taxe_line', store=True, readonly=True)
     transit_id = fields.Many2one(
         'folder.transit',
         string='Dossier',
+        index=True,
     )
     price_taxed = fields.Float(
         compute='_compute_taxe_line',
@@ -44,5 +67,11 @@ class TransitDebour(models.Model):
     tax_id = fields.Many2many('account.tax', string='Taxes',
                               domain=['|', ('active', '=', False), ('active', '=', True)])
     attach_files_ids = fields.Many2many('ir.attachment', string="Pieces Jointes")
+    invoice_ids = fields.Many2many('account.move', 'account_move_debour_transit_rel',
+                                   'debour_transit_id', 'account_move_id',
+                                   string='Factures', readonly=True, copy=False)
+    billing_state = fields.Selection([('unbilled', 'Non Facture'), ('billed', 'Facture')],
+                                     string='Etat Facturation', compute='_compute_billing_state',
+                                     store=True, index=True)
 
 
@@ -1,12 +1,25 @@
-from odoo import models, fields, api, SUPERUSER_ID, _
+from odoo import models, fields, api, tools, SUPERUSER_ID, _
 from odoo.exceptions import UserError,ValidationError
+from odoo.osv import expression
+from . import iso6346
 from odoo.tools import float_is_zero, float_compare, DEFAULT_SERVER_DATETIME_FORMAT
 
+from collections import defaultdict
 from datetime import datetime, timedelta, date
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Champs de references documentaires couverts par la recherche "toute reference"
+FOLDER_REFERENCE_FIELDS = [
+    'name', 'num_ot', 'num_brd', 'num_di', 'num_avi', 'num_besc',
+    'num_rvc', 'num_rvc_1', 'num_rvc_2', 'num_rvc_3', 'num_rvc_4', 'num_rvc_5',
+    'num_quittance', 'num_manifeste', 'num_liquidation',
+]
+
+# Types d'activite des alertes ETA: planifies par le cron des alertes, hors plan d'activites des processus
+ALERTE_ACTIVITY_TYPES = ['inov_transit.mail_activity_alerte_danger', 'inov_transit.mail_activity_alerte_overdue']
+
 AVAILABLE_PRIORITIES = [
     ('0', 'Low'),
     ('1', 'Medium'),
@@ -17,17 +30,20 @@ AVAILABLE_PRIORITIES = [
 
 class TransitFolder(models.Model):
     _name = "folder.transit"
-    _inherit = ['mail.thread', 'mail.activity.mixin', 'analytic.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'analytic.mixin', 'transit.attachment.mixin']
     _description = "Dossier de Transit"
     _order = "date_open desc"
+    _transit_attachment_fields = ('attachment_files',)
 
 
     @api.depends('task_checklist', 'stages')
     def _get_checklist_progress(self):
         """:return the value for the check list progress"""
+        # Nombre total de tâches par processus, compté une seule fois pour tous les dossiers
+        activities_by_stage = dict(self.env['mail.activity.type']._read_group(
+            [('stages', 'in', list(set(self.mapped('stages'))))], ['stages'], ['__count']))
         for rec in self:
-            # Calculer le nombre total de tâches pour cette étape
-            total_activities = rec.env['mail.activity.type'].search_count([('stages', '=', rec.stages)])
+            total_activities = activities_by_stage.get(rec.stages, 0)
             total_len = total_activities or rec.len_task or 1  # Éviter la division par zéro
             
             # Compter les tâches accomplies
@@ -65,6 +81,11 @@ class TransitFolder(models.Model):
         for record in self:
             record.service_count = len(record.debour_ids) if record.debour_ids else 0
 
+    @api.depends('debour_ids.amount_debour')
+    def _compute_amount_debours(self):
+        for record in self:
+            record.amount_debours = sum(record.debour_ids.mapped('amount_debour'))
+
     @api.depends('order_ids')
     def get_total_order_ids_amount(self):
         self.amount_purchased = sum(a.chiffr_xaf_take for a in self.order_ids)
@@ -373,8 +394,8 @@ class TransitFolder(models.Model):
         """Méthode supprimée car plus nécessaire"""
         pass
 
-    name = fields.Char(string='Dossier N°', copy=False, index=True, readonly=True, default=lambda self: _('New'))
-    num_ot = fields.Char(string='N° OT')
+    name = fields.Char(string='Dossier N°', copy=False, index='trigram', readonly=True, default=lambda self: _('New'))
+    num_ot = fields.Char(string='N° OT', index='trigram')
     number = fields.Integer('code', default=_default_number)
     number_stage = fields.Integer('code residual', default=50)
     date_open = fields.Date("Date de Reception OT")
@@ -383,7 +404,7 @@ class TransitFolder(models.Model):
     # date_departure= fields.Date("ETD")
     transpo_type = fields.Selection([('input', 'Chargement'), ('output', 'Dechargement')],
                                     string="Operation sur le navire", default='')
-    date_arrival = fields.Date("ETA", tracking=True)
+    date_arrival = fields.Date("ETA", tracking=True, index=True)
     date_declaration = fields.Date("Date de declaration", tracking=True)
     date_guce = fields.Date("Date de GUCE", tracking=True)
     date_validate = fields.Date("Ordre de Validation", tracking=True)
@@ -401,7 +422,8 @@ class TransitFolder(models.Model):
     customer_id = fields.Many2one(
         'res.partner',
         string='Client',
-        tracking=True
+        tracking=True,
+        index=True,
     )
 
     vendor_id = fields.Many2one(
@@ -453,6 +475,7 @@ class TransitFolder(models.Model):
 
     num_di = fields.Char(
         string='N° DI',
+        index='trigram',
     )
     code_camsi = fields.Char(
         string='Code CAMSI',
@@ -462,37 +485,47 @@ class TransitFolder(models.Model):
     )
     num_avi = fields.Char(
         string='N° Guce',
+        index='trigram',
     )
     num_besc = fields.Char(
-        string='BESC'
+        string='BESC',
+        index='trigram',
     )
     num_pr = fields.Char(
         string='PR'
     )
     num_rvc = fields.Char(
-        string='RVC'
+        string='RVC',
+        index='trigram',
     )
     num_rvc_1 = fields.Char(
-        string='2eme RVC'
+        string='2eme RVC',
+        index='trigram',
     )
     num_rvc_2 = fields.Char(
-        string='3eme RVC'
+        string='3eme RVC',
+        index='trigram',
     )
     num_rvc_3 = fields.Char(
-        string='4eme RVC'
+        string='4eme RVC',
+        index='trigram',
     )
     num_rvc_4 = fields.Char(
-        string='5eme RVC'
+        string='5eme RVC',
+        index='trigram',
     )
     num_rvc_5 = fields.Char(
-        string='6eme RVC'
+        string='6eme RVC',
+        index='trigram',
     )
 
     num_quittance = fields.Char(
         string='N° Quittance',
+        index='trigram',
     )
     num_manifeste = fields.Char(
         string='MANIFESTE',
+        index='trigram',
     )
     num_pad = fields.Char(
         string='PAD',
@@ -502,6 +535,7 @@ class TransitFolder(models.Model):
     )
     num_liquidation = fields.Char(
         string='N° Declaration',
+        index='trigram',
     )
     vessel = fields.Many2one(
         'vessel.transit',
@@ -522,8 +556,12 @@ class TransitFolder(models.Model):
     type_validated = fields.Selection([('open', ''), ('close', 'Valide')], string="Valide", default='open')
     amount_purchased = fields.Float("Valeur imposable en CFA", tracking=True)
     amount_douane = fields.Float("Droit de douane")
-    num_brd = fields.Char("Numero de B/L", track_visibility='onchange')
+    num_brd = fields.Char("Numero de B/L", track_visibility='onchange', index='trigram')
+    any_reference = fields.Char("Toute Reference", compute='_compute_any_reference',
+                                search='_search_any_reference')
     debour_ids = fields.One2many('debour.transit', 'transit_id', string="services")
+    amount_debours = fields.Monetary("Total Debours", compute='_compute_amount_debours',
+                                     currency_field='currency_id', store=True)
 
     order_ids = fields.One2many('invoice.transit', 'folder_id', string="Marchandises")
     # order_ids=fields.Many2many('invoice.transit',string="Marchandises")
@@ -650,19 +688,51 @@ class TransitFolder(models.Model):
         
         # Si le nom du dossier change, synchroniser avec le compte analytique
         if 'name' in values:
-            for record in self:
-                if record.analytic_distribution:
-                    # Récupérer le compte analytique lié
-                    account_ids = []
-                    for account_ids_str in record.analytic_distribution.keys():
-                        account_ids.extend([int(id_) for id_ in account_ids_str.split(',')])
-                    
-                    if account_ids:
-                        analytic_account = record.env['account.analytic.account'].browse(account_ids[0])
-                        if analytic_account.exists():
-                            analytic_account.write({'name': record.name})
+            self._sync_analytic_account_names()
         
         return result
+
+    def _compute_any_reference(self):
+        for record in self:
+            record.any_reference = False
+
+    def _search_any_reference(self, operator, value):
+        """ Recherche sur toutes les references documentaires du dossier et sur ses conteneurs.
+        Chaque champ porte un index trigramme: PostgreSQL combine les index au lieu de parcourir la table.
+        Les conteneurs sont resolus d'abord (index trigramme de package_folders) puis ajoutes en liste d'ids:
+        un sous-select id IN (...) empecherait le BitmapOr et forcerait un parcours de folder_transit """
+        if isinstance(value, str):
+            value = value.strip()
+        negative = operator in expression.NEGATIVE_TERM_OPERATORS
+        package_operator = expression.TERM_OPERATORS_NEGATION[operator] if negative else operator
+        folder_ids = [folder.id for folder, in self.env['package.folders']._read_group(
+            [('name', package_operator, value), ('transit_id', '!=', False)], ['transit_id'])]
+        domains = [[(fname, operator, value)] for fname in FOLDER_REFERENCE_FIELDS]
+        if negative:
+            domains.append([('id', 'not in', folder_ids)])
+            return expression.AND(domains)
+        domains.append([('id', 'in', folder_ids)])
+        return expression.OR(domains)
+
+    def _sync_analytic_account_names(self):
+        """ Renomme en une passe les comptes analytiques lies (premier compte de la distribution) dont le
+        nom differe de celui du dossier: une lecture des comptes, une ecriture par nom distinct """
+        name_by_account = {}
+        for record in self:
+            if record.analytic_distribution:
+                for account_ids_str in record.analytic_distribution.keys():
+                    account_ids = [int(id_) for id_ in account_ids_str.split(',') if id_]
+                    if account_ids:
+                        name_by_account[account_ids[0]] = record.name
+                        break
+        if not name_by_account:
+            return
+        accounts_by_name = defaultdict(list)
+        for account in self.env['account.analytic.account'].browse(list(name_by_account)).exists():
+            if account.name != name_by_account[account.id]:
+                accounts_by_name[name_by_account[account.id]].append(account.id)
+        for name, account_ids in accounts_by_name.items():
+            self.env['account.analytic.account'].browse(account_ids).write({'name': name})
     
     
     def get_next_activities(self):
@@ -715,20 +785,21 @@ class TransitFolder(models.Model):
                 'len_task': len(self.env['mail.activity.type'].search([('stages', '=', result.stages)]))
             })
 
-        # Créer les activités initiales pour le transit
-        for task in res:
-            create_vals = {
-                'activity_type_id': task,
-                'summary': result.env['mail.activity.type'].browse([task]).name,
+        # Créer et valider en une fois les activités initiales pour le transit
+        if res:
+            date_deadline = result.compute_deadline_date(result.date_open, 0)
+            res_model_id = result.env['ir.model']._get(result._name).id
+            activities = result.env['mail.activity'].create([{
+                'activity_type_id': activity_type.id,
+                'summary': activity_type.name,
                 'automated': True,
                 'note': '',
-                'date_deadline': result.compute_deadline_date(result.date_open, 0),
-                'res_model_id': result.env['ir.model']._get(result._name).id,
+                'date_deadline': date_deadline,
+                'res_model_id': res_model_id,
                 'res_id': result.id,
                 'stages': result.stages
-            }
-            activity = result.env['mail.activity'].create(create_vals)
-            activity.action_feedback()
+            } for activity_type in result.env['mail.activity.type'].browse(res)])
+            activities.with_context(transit_checklist_auto=True).action_feedback_batch()
             
       
         return result
@@ -745,26 +816,64 @@ class TransitFolder(models.Model):
             self.stage_id = self.activity_type_id.stage_id.id
         return True   
 
+    @api.model
+    @tools.ormcache()
+    def _get_activity_plans(self):
+        """ Enchainement ordonne (sequence, id) des types d'activite de chaque processus, alertes ETA exclues
+        :return {processus: (id type d'activite, ...)}
+        """
+        plans = defaultdict(list)
+        alerte_ids = [activity_type.id for activity_type in (self.env.ref(xmlid, raise_if_not_found=False)
+                                                              for xmlid in ALERTE_ACTIVITY_TYPES) if activity_type]
+        domain = [('stages', '!=', False), ('id', 'not in', alerte_ids)]
+        for activity_type in self.env['mail.activity.type'].sudo().search(domain):
+            plans[activity_type.stages].append(activity_type.id)
+        return {stages: tuple(type_ids) for stages, type_ids in plans.items()}
+
+    def compute_business_deadline(self, date, days):
+        """ Date situee a `days` jours ouvres (hors samedi et dimanche) de la date donnee """
+        deadline = fields.Date.to_date(date or self.create_date)
+        while days > 0:
+            deadline += timedelta(days=1)
+            if deadline.weekday() < 5:
+                days -= 1
+        return deadline
+
+    def _get_next_activity_type(self, plan):
+        """ Premiere activite du plan qui n'a pas encore ete realisee sur le dossier """
+        self.ensure_one()
+        done_type_ids = set(self.task_checklist.activity_type_id.ids)
+        done_names = set(self.task_checklist.filtered(lambda check: not check.activity_type_id).mapped('name'))
+        for activity_type in plan:
+            if activity_type.id not in done_type_ids and activity_type.name not in done_names:
+                return activity_type
+        return plan.browse()
+
     def activity_scheduler(self): 
+        """ Planifie la prochaine activite de chaque dossier selectionne d'apres le plan de son processus,
+        en une seule creation d'activites """
+        plans = self._get_activity_plans()
+        ActivityType = self.env['mail.activity.type']
+        res_model_id = self.env['ir.model']._get(self._name).id
+        vals_list = []
         for record in self:
-            if not record.task_checklist:
-                activity_xml = ''
-                if record.stages == 'transit':
-                    activity_xml = 'inov_transit.mail_act_rh_courrier_order'
-                if record.stages == 'accone':
-                    activity_xml = 'inov_transit.mail_act_rh_courrier_order'
-                if record.stages == 'ship':
-                    activity_xml = 'inov_shipping.mail_act_rh_shipping_0'
-            else:
-                activity_xml = record.activity_type_id.name
-                
-            record.activity_schedule(
-            act_type_xmlid = activity_xml,
-            date_deadline = record.compute_deadline_date(record.date_open, 2),
-            note='',
-            summary = self.env.ref(activity_xml).name,
-            user_id = self.env.ref(activity_xml).responsible_id.id)
-            record.is_scheduled = True
+            activity_type = record._get_next_activity_type(ActivityType.browse(plans.get(record.stages, ())))
+            if not activity_type or activity_type in record.activity_ids.activity_type_id:
+                continue
+            vals_list.append({
+                'activity_type_id': activity_type.id,
+                'summary': activity_type.name,
+                'automated': True,
+                'note': '',
+                'date_deadline': record.compute_business_deadline(record.date_open, 2),
+                'user_id': activity_type.responsible_id.id or activity_type.default_user_id.id or self.env.uid,
+                'res_model_id': res_model_id,
+                'res_id': record.id,
+                'stages': record.stages,
+            })
+        if vals_list:
+            self.env['mail.activity'].create(vals_list)
+        self.write({'is_scheduled': True})
         return True
 
     
@@ -1165,15 +1274,41 @@ class TransitFolder(models.Model):
     #         record.update(values)
 
 
-    def action_create_invoice(self):
+    def _prepare_invoice_values(self):
+        """ Valeurs de la facture du dossier: seuls les debours non encore factures sont repris """
         self.ensure_one()
-        invoice_obj = self.env['account.move']
-        invoice_id = invoice_obj.create({
+        return {
             'partner_id': self.customer_id.id,
             'transit_id': self.id,
-            'service_ids': [(6, 0, self.debour_ids.ids)],
+            'service_ids': [(6, 0, self.debour_ids.filtered(lambda d: d.billing_state == 'unbilled').ids)],
             'origin': self.name,
+        }
+
+    def _create_invoices(self):
+        """ Cree les factures de plusieurs dossiers en un seul appel a create, une facture par dossier
+        (le paiement et le cache des PDF s'appuient sur le dossier de la facture), puis poste les
+        messages d'origine en masse
+        :return account.move
+        """
+        folders = self.filtered(lambda f: f.customer_id)
+        if folders != self:
+            raise UserError(_('Veuillez renseigner le client des dossiers: %s')
+                            % ', '.join((self - folders).mapped('name')))
+        # Prechargement des clients et debours de tous les dossiers
+        folders.mapped('customer_id')
+        folders.mapped('debour_ids.billing_state')
+        invoices = self.env['account.move'].create([folder._prepare_invoice_values() for folder in folders])
+        QWeb = self.env['ir.qweb']
+        invoices._message_log_batch(bodies={
+            invoice.id: QWeb._render('mail.message_origin_link', {'self': invoice, 'origin': folder})
+            for invoice, folder in zip(invoices, folders)
         })
+        return invoices
+
+    def action_create_invoice(self):
+        self.ensure_one()
+        invoice_obj = self.env['account.move']
+        invoice_id = invoice_obj.create(self._prepare_invoice_values())
         action = self.env.ref('account.action_invoice_tree1').read()[0]
         action['views'] = [(self.env.ref('account.move_form').id, 'form')]
         action['res_id'] = invoice_id.id
@@ -1293,7 +1428,11 @@ class NavireTransit(models.Model):
 class PackageFolder(models.Model):
     _name = 'package.folders'
 
-    name = fields.Char("Numero du Conteneur", size=11, )
+    name = fields.Char("Numero du Conteneur", size=11, index='trigram')
+    container_number = fields.Char("Numero Normalise", compute='_compute_container_number', store=True, index=True)
+    container_valid = fields.Boolean("Numero ISO Valide", compute='_compute_container_number', store=True)
+    is_duplicate = fields.Boolean("En double", compute='_compute_is_duplicate',
+                                  help="Conteneur deja present sur un autre dossier actif, non retourne")
     package_type_id = fields.Many2one(
         'package.transit',
         string='Type de Conteneur',
@@ -1305,5 +1444,43 @@ class PackageFolder(models.Model):
     date_return = fields.Date("Date Retour")
     transit_id = fields.Many2one(
         "folder.transit",
-        "Dossier"
+        "Dossier",
+        index=True,
     )
+
+    @api.depends('name')
+    def _compute_container_number(self):
+        validation = iso6346.validate_batch(self.mapped('name'))
+        for package in self:
+            package.container_number, package.container_valid = validation.get(package.name, ('', False))
+
+    def _compute_is_duplicate(self):
+        # Chaque conteneur n'est compare qu'aux autres conteneurs: deux conteneurs identiques affiches
+        # ensemble (liste du dossier, liste globale) se signalent mutuellement
+        duplicates = self._get_active_duplicates(self.mapped('container_number'), by_package=True)
+        for package in self:
+            package.is_duplicate = any(
+                package_id != package.id for package_id in duplicates.get(package.container_number, ()))
+
+    @api.model
+    def _get_active_duplicates(self, numbers, exclude_ids=(), by_package=False):
+        """ Conteneurs deja presents sur un dossier actif et non encore retournes
+        :param by_package: renvoyer les ids des conteneurs plutot que ceux des dossiers
+        :return {numero normalise: [id dossier, ...]} ou {numero normalise: [id conteneur, ...]}
+        """
+        numbers = [number for number in set(numbers) if number]
+        if not numbers:
+            return {}
+        self.flush_model(['container_number', 'transit_id', 'date_return'])
+        self.env['folder.transit'].flush_model(['active'])
+        self.env.cr.execute("""
+            SELECT p.container_number, ARRAY_AGG(DISTINCT {column})
+              FROM package_folders p
+              JOIN folder_transit f ON f.id = p.transit_id
+             WHERE p.container_number = ANY(%s)
+               AND p.id != ALL(%s)
+               AND p.date_return IS NULL
+               AND f.active
+          GROUP BY p.container_number
+        """.format(column='p.id' if by_package else 'p.transit_id'), [numbers, list(exclude_ids)])
+        return dict(self.env.cr.fetchall())
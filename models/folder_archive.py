@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import gzip
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.osv import expression
+
+_logger = logging.getLogger(__name__)
+
+# Anciennete minimale (jours depuis la fermeture) par defaut, surchargeable par inov_transit.archive_after_days
+ARCHIVE_AFTER_DAYS = 730
+
+# Nombre de dossiers archives par transaction
+ARCHIVE_CHUNK_SIZE = 50
+
+# Champs jamais serialises (recalcules ou remis a la restauration)
+ARCHIVE_SKIP_FIELDS = {'id', 'create_uid', 'write_uid', 'write_date', '__last_update'}
+
+# Champs des messages non archives: notifications (mail_notification) et favoris. Restaures tels quels,
+# ils ramenaient d'anciens messages non lus dans les boites de reception
+ARCHIVE_MESSAGE_SKIP_FIELDS = ('model', 'res_id', 'parent_id', 'record_name', 'notified_partner_ids',
+                               'starred_partner_ids')
+
+# Enregistrements enfants deplaces dans l'archive: (cle, modele, champ vers le dossier)
+ARCHIVE_CHILDREN = [
+    ('checklist', 'task.checklist', 'folder_id'),
+    ('packages', 'package.folders', 'transit_id'),
+    ('orders', 'invoice.transit', 'folder_id'),
+]
+
+
+class TransitFolderArchive(models.Model):
+    _name = 'folder.transit.archive'
+    _description = 'Archive froide des dossiers clotures'
+    _order = 'archive_date desc, id desc'
+
+    folder_id = fields.Many2one('folder.transit', string='Dossier', required=True, ondelete='cascade', index=True)
+    name = fields.Char(related='folder_id.name', string='Dossier N°')
+    customer_id = fields.Many2one(related='folder_id.customer_id', string='Client')
+    state = fields.Selection([('archived', 'Archive'), ('restored', 'Restaure')], string='Etat',
+                             default='archived', required=True, index=True)
+    archive_date = fields.Datetime("Archive le", default=fields.Datetime.now, readonly=True)
+    restore_date = fields.Datetime("Restaure le", readonly=True)
+    payload = fields.Binary("Contenu (JSON compresse)", attachment=True, readonly=True)
+    payload_size = fields.Integer("Taille (octets)", readonly=True)
+    message_count = fields.Integer("Messages", readonly=True)
+    record_count = fields.Integer("Enregistrements", readonly=True)
+
+    # ------------------------------------------------------------------
+    # Serialisation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _archive_fnames(self, model_name, exclude=()):
+        """ Champs stockes et saisis du modele: les champs calcules et les one2many sont reconstruits """
+        Model = self.env[model_name]
+        return [
+            fname for fname, field in Model._fields.items()
+            if field.store and not field.compute and not field.related
+            and field.type not in ('one2many', 'binary')
+            and fname not in ARCHIVE_SKIP_FIELDS and fname not in exclude
+        ]
+
+    @api.model
+    def _serialize(self, records, exclude=()):
+        """ Valeurs des enregistrements, many2one en identifiants, avec leur id d'origine sous '__id' """
+        if not records:
+            return []
+        fnames = self._archive_fnames(records._name, exclude)
+        result = []
+        for values in records.read(fnames, load=None):
+            values['__id'] = values.pop('id')
+            result.append(values)
+        return result
+
+    @api.model
+    def _deserialize(self, model_name, vals_list):
+        """ Valeurs de creation: les references vers des enregistrements supprimes depuis l'archivage
+        sont ecartees, en une verification par modele lie """
+        Model = self.env[model_name]
+        referenced = {}
+        for vals in vals_list:
+            for fname, value in vals.items():
+                field = Model._fields.get(fname)
+                if field and field.type == 'many2one' and value:
+                    referenced.setdefault(field.comodel_name, set()).add(value)
+                elif field and field.type == 'many2many' and value:
+                    referenced.setdefault(field.comodel_name, set()).update(value)
+        existing = {
+            comodel: set(self.env[comodel].sudo().browse(ids).exists().ids)
+            for comodel, ids in referenced.items()
+        }
+        result = []
+        for vals in vals_list:
+            clean = {}
+            for fname, value in vals.items():
+                field = Model._fields.get(fname)
+                if not field or fname.startswith('__'):
+                    continue
+                if field.type == 'many2one':
+                    value = value if value in existing.get(field.comodel_name, ()) else False
+                elif field.type == 'many2many':
+                    value = [(6, 0, [id_ for id_ in value or [] if id_ in existing.get(field.comodel_name, ())])]
+                clean[fname] = value
+            result.append(clean)
+        return result
+
+    @api.model
+    def _build_payload(self, folder):
+        """ Contenu froid d'un dossier: historique, activites, abonnes, check list, conteneurs et marchandises """
+        Message = self.env['mail.message'].sudo()
+        messages = Message.search([('model', '=', folder._name), ('res_id', '=', folder.id)], order='id')
+        message_data = self._serialize(messages, exclude=ARCHIVE_MESSAGE_SKIP_FIELDS)
+        trackings = self.env['mail.tracking.value'].sudo().search([('mail_message_id', 'in', messages.ids)])
+        tracking_by_message = {}
+        for values in self._serialize(trackings):
+            tracking_by_message.setdefault(values.pop('mail_message_id'), []).append(values)
+        for values in message_data:
+            values['__trackings'] = tracking_by_message.get(values['__id'], [])
+
+        payload = {
+            'messages': message_data,
+            'activities': self._serialize(folder.sudo().activity_ids, exclude=('res_model', 'res_id', 'res_model_id')),
+            'followers': [
+                {'partner_id': follower.partner_id.id, 'subtype_ids': follower.subtype_ids.ids}
+                for follower in folder.sudo().message_follower_ids if follower.partner_id
+            ],
+        }
+        for key, model_name, inverse_name in ARCHIVE_CHILDREN:
+            children = self.env[model_name].sudo().search([(inverse_name, '=', folder.id)], order='id')
+            payload[key] = self._serialize(children, exclude=(inverse_name,))
+            if model_name == 'invoice.transit':
+                lines = self.env['product.transit'].sudo().search([('invoice_id', 'in', children.ids)], order='id')
+                payload['order_lines'] = self._serialize(lines)
+        return payload, messages
+
+    # ------------------------------------------------------------------
+    # Archivage / restauration
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _archive_folders(self, folders):
+        """ Deplace le contenu des dossiers dans leurs archives et ne laisse dans les tables chaudes que
+        le dossier lui-meme, inactif: il reste la reference des factures, debours, comptes analytiques et
+        pieces jointes, et sert de fiche de recherche """
+        archives = self.browse()
+        for folder in folders:
+            payload, messages = self._build_payload(folder)
+            content = gzip.compress(json.dumps(payload, default=str).encode())
+            archive = self.sudo().create({
+                'folder_id': folder.id,
+                'payload': base64.b64encode(content),
+                'payload_size': len(content),
+                'message_count': len(payload['messages']),
+                'record_count': sum(len(payload[key]) for key, _model, _inverse in ARCHIVE_CHILDREN)
+                                + len(payload['order_lines']) + len(payload['activities']),
+            })
+            folder.sudo().with_context(tracking_disable=True).write({
+                'archive_containers': ' '.join(values['name'] for values in payload['packages'] if values.get('name')),
+            })
+            messages.unlink()
+            folder.sudo().activity_ids.unlink()
+            folder.sudo().message_follower_ids.unlink()
+            self.env['product.transit'].sudo().search([('invoice_id', 'in', folder.sudo().order_ids.ids)]).unlink()
+            for _key, model_name, inverse_name in ARCHIVE_CHILDREN:
+                self.env[model_name].sudo().search([(inverse_name, '=', folder.id)]).unlink()
+            archives |= archive
+        folders.with_context(tracking_disable=True).write({'archive_state': 'cold', 'active': False})
+        return archives
+
+    def _load_payload(self):
+        self.ensure_one()
+        return json.loads(gzip.decompress(base64.b64decode(self.payload)))
+
+    def action_restore(self):
+        """ Recree le contenu archive sur le dossier et le remet dans les tables chaudes """
+        for archive in self.filtered(lambda arch: arch.state == 'archived'):
+            folder = archive.folder_id.sudo()
+            payload = archive._load_payload()
+            folder.with_context(tracking_disable=True).write({
+                'archive_state': 'hot', 'active': True, 'archive_containers': False})
+
+            for key, model_name, inverse_name in ARCHIVE_CHILDREN:
+                vals_list = self._deserialize(model_name, payload.get(key, []))
+                for vals in vals_list:
+                    vals[inverse_name] = folder.id
+                records = self.env[model_name].sudo().create(vals_list)
+                if model_name == 'invoice.transit':
+                    order_map = dict(zip([vals['__id'] for vals in payload.get(key, [])], records.ids))
+                    lines = payload.get('order_lines', [])
+                    line_vals = self._deserialize('product.transit', lines)
+                    for vals, raw in zip(line_vals, lines):
+                        vals['invoice_id'] = order_map.get(raw.get('invoice_id'), False)
+                    self.env['product.transit'].sudo().create(line_vals)
+
+            messages = payload.get('messages', [])
+            message_vals = self._deserialize('mail.message', messages)
+            for vals, raw in zip(message_vals, messages):
+                # Archives anterieures a l'exclusion des notifications: l'historique revient sans notifier
+                for fname in ARCHIVE_MESSAGE_SKIP_FIELDS:
+                    vals.pop(fname, None)
+                vals.update({
+                    'model': folder._name,
+                    'res_id': folder.id,
+                    'tracking_value_ids': [(0, 0, tracking) for tracking in
+                                           self._deserialize('mail.tracking.value', raw.get('__trackings', []))],
+                })
+            self.env['mail.message'].sudo().create(message_vals)
+
+            activity_vals = self._deserialize('mail.activity', payload.get('activities', []))
+            res_model_id = self.env['ir.model']._get(folder._name).id
+            for vals in activity_vals:
+                vals.update({'res_model_id': res_model_id, 'res_id': folder.id})
+            # Activites deja attribuees avant l'archivage: pas de nouveau courriel d'assignation
+            self.env['mail.activity'].sudo().with_context(
+                mail_activity_quick_update=True, mail_notrack=True).create(activity_vals)
+
+            for follower in payload.get('followers', []):
+                folder.message_subscribe(partner_ids=[follower['partner_id']],
+                                         subtype_ids=follower['subtype_ids'] or None)
+
+            archive.write({'state': 'restored', 'restore_date': fields.Datetime.now(), 'payload': False})
+        return True
+
+    # ------------------------------------------------------------------
+    # Traitement par lots
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _claim_folders(self, cutoff, limit, skip_ids):
+        """ Reserve un lot de dossiers a archiver, en ignorant ceux deja pris par un autre traitement """
+        self.env.cr.execute("""
+            SELECT id
+              FROM folder_transit
+             WHERE archive_state = 'hot'
+               AND date_close < %s
+               AND id != ALL(%s)
+          ORDER BY date_close, id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [cutoff, list(skip_ids), limit])
+        return self.env['folder.transit'].browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_archive_closed_folders(self, chunk_size=ARCHIVE_CHUNK_SIZE, max_chunks=None, auto_commit=True):
+        """ Archive par lots les dossiers fermes depuis plus longtemps que la duree configuree.
+        Chaque lot est valide (commit) a part: une execution interrompue reprend aux dossiers restants.
+        Un lot en echec est rejoue dossier par dossier, les dossiers fautifs sont ignores jusqu'a la
+        prochaine execution.
+        """
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'inov_transit.archive_after_days', ARCHIVE_AFTER_DAYS))
+        cutoff = fields.Date.context_today(self) - timedelta(days=days)
+        failed_ids = set()
+        archived = chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            folders = self._claim_folders(cutoff, chunk_size, failed_ids)
+            if not folders:
+                break
+            chunks += 1
+            folder_ids = folders.ids
+            try:
+                with self.env.cr.savepoint():
+                    self._archive_folders(folders)
+                archived += len(folder_ids)
+            except Exception:
+                if not auto_commit:
+                    raise
+                _logger.exception("Archivage des dossiers: echec du lot, reprise dossier par dossier")
+                self.env.invalidate_all()
+                for folder in self.env['folder.transit'].browse(folder_ids):
+                    try:
+                        with self.env.cr.savepoint():
+                            self._archive_folders(folder)
+                        archived += 1
+                    except Exception:
+                        _logger.exception("Archivage du dossier %s impossible", folder.id)
+                        self.env.invalidate_all()
+                        failed_ids.add(folder.id)
+            if auto_commit:
+                self.env.cr.commit()
+        _logger.info("Archivage des dossiers: %s dossier(s) archive(s) en %s lot(s), %s en echec",
+                     archived, chunks, len(failed_ids))
+        return archived
+
+
+class TransitFolderArchiveState(models.Model):
+    _inherit = 'folder.transit'
+
+    archive_state = fields.Selection([('hot', 'Actif'), ('cold', 'Archive')], string='Stockage', default='hot',
+                                     required=True, index=True, copy=False, readonly=True)
+    archive_ids = fields.One2many('folder.transit.archive', 'folder_id', string='Archives', readonly=True)
+    archive_containers = fields.Char("Conteneurs Archives", index='trigram', readonly=True, copy=False)
+
+    def _search_any_reference(self, operator, value):
+        # Les conteneurs des dossiers archives restent retrouvables depuis la fiche du dossier
+        domain = super(TransitFolderArchiveState, self)._search_any_reference(operator, value)
+        if isinstance(value, str):
+            value = value.strip()
+        if operator in expression.NEGATIVE_TERM_OPERATORS:
+            return expression.AND([domain, [('archive_containers', operator, value)]])
+        return expression.OR([domain, [('archive_containers', operator, value)]])
+
+    def action_restore_archive(self):
+        self.archive_ids.filtered(lambda archive: archive.state == 'archived').action_restore()
+        return True
+
+    def action_archive_cold(self):
+        """ Archivage immediat des dossiers selectionnes (fermes uniquement) """
+        if self.filtered(lambda folder: not folder.date_close):
+            raise UserError(_("Seuls les dossiers fermes peuvent etre archives."))
+        self.env['folder.transit.archive']._archive_folders(self.filtered(lambda f: f.archive_state == 'hot'))
+        return True
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+
+from markupsafe import Markup
+
+from odoo import models, fields, _
+from odoo.http import request
+
+
+class TransitFolderBulkLog(models.Model):
+    _name = 'folder.transit.bulk.log'
+    _description = 'Journal des mises a jour groupees des dossiers'
+    _order = 'id desc'
+
+    name = fields.Char("Libelle", required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='Utilisateur', readonly=True, default=lambda self: self.env.user)
+    date = fields.Datetime("Date", readonly=True, default=fields.Datetime.now)
+    folder_count = fields.Integer("Dossiers", readonly=True)
+    change_count = fields.Integer("Modifications", readonly=True)
+    field_names = fields.Char("Champs modifies", readonly=True)
+    diff_attachment_id = fields.Many2one('ir.attachment', string='Differences (CSV)', readonly=True)
+
+    def action_download_diff(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % self.diff_attachment_id.id,
+            'target': 'self',
+        }
+
+
+class TransitFolderBulk(models.Model):
+    _inherit = 'folder.transit'
+
+    def write(self, values):
+        mode = self._bulk_tracking_mode()
+        if mode == 'import':
+            # Import: une ecriture par ligne, les differences sont cumulees puis journalisees a la fin de load()
+            records = self.with_context(transit_bulk_tracking=False, mail_notrack=True)
+            changes = self._bulk_tracked_diff(set(values), lambda: super(TransitFolderBulk, records).write(values))
+            collected = self.env.context['transit_bulk_changes']
+            for folder_id, lines in changes.items():
+                collected.setdefault(folder_id, []).extend(lines)
+            return True
+        if not mode or len(self) <= 1:
+            return super(TransitFolderBulk, self).write(values)
+        # Ecriture unique plus haut dans la chaine: les surcharges chargees apres ce module
+        # (evenements, synchronisation) ne sont executees qu'une fois
+        records = self.with_context(transit_bulk_tracking=False, mail_notrack=True)
+        self._bulk_tracked_apply(set(values), lambda: super(TransitFolderBulk, records).write(values), mode)
+        return True
+
+    def _bulk_tracking_mode(self):
+        """ Mode de suivi groupe de l'ecriture: cle de contexte transit_bulk_tracking, a defaut 'folder'
+        pour une modification multiple depuis la vue liste (write appele directement par le client web
+        sur plusieurs dossiers). Les ecritures des boutons et du code serveur gardent le suivi standard.
+        """
+        if 'transit_bulk_tracking' in self.env.context:
+            return self.env.context['transit_bulk_tracking']
+        if len(self) > 1 and request and getattr(request, 'params', None):
+            params = request.params
+            if params.get('model') == self._name and params.get('method') == 'write':
+                return 'folder'
+        return False
+
+    def load(self, field_names, data):
+        """ Import (base_import): un seul journal avec les differences en CSV au lieu d'un message de
+        suivi par dossier importe. Rien n'est journalise si l'import echoue ou n'est qu'un test. """
+        if self.env.context.get('transit_bulk_tracking') == 'import':
+            return super(TransitFolderBulk, self).load(field_names, data)
+        changes = {}
+        result = super(TransitFolderBulk, self.with_context(
+            transit_bulk_tracking='import', transit_bulk_changes=changes)).load(field_names, data)
+        if result.get('ids') and changes:
+            self.browse(list(changes))._bulk_log_batch(changes)
+        return result
+
+    def _bulk_tracking_snapshot(self, fnames):
+        """ Valeurs affichables des champs suivis: {id dossier: {champ: texte}} """
+        snapshot = {}
+        for record in self:
+            values = {}
+            for fname in fnames:
+                value = self._fields[fname].convert_to_export(record[fname], record)
+                values[fname] = '' if value is False or value is None else str(value)
+            snapshot[record.id] = values
+        return snapshot
+
+    def _bulk_tracked_diff(self, written, apply):
+        """ Applique les ecritures (apply) et renvoie les differences des champs suivis
+        :return dict {id dossier: [(champ, ancienne valeur, nouvelle valeur)]}
+        """
+        tracked = sorted(fname for fname in self._track_get_fields() if fname in written)
+        before = self._bulk_tracking_snapshot(tracked)
+        apply()
+        self.invalidate_recordset(tracked)
+        after = self._bulk_tracking_snapshot(tracked)
+        changes = {
+            folder_id: [(fname, before[folder_id][fname], after[folder_id][fname])
+                        for fname in tracked if before[folder_id][fname] != after[folder_id][fname]]
+            for folder_id in before
+        }
+        return {folder_id: lines for folder_id, lines in changes.items() if lines}
+
+    def _bulk_tracked_apply(self, written, apply, mode):
+        """ Applique les ecritures (apply) puis journalise les differences des champs suivis
+        :return le journal en mode 'batch', sinon True
+        """
+        changes = self._bulk_tracked_diff(written, apply)
+        if not changes:
+            return True
+        if mode == 'batch':
+            return self._bulk_log_batch(changes)
+        self._bulk_log_per_folder(changes)
+        return True
+
+    def bulk_update(self, values, mode='folder'):
+        """ Mise a jour en masse sans suivi champ par champ.
+        :param values: valeurs communes a tous les dossiers, ou {id dossier: valeurs}
+        :param mode: 'folder' pour un message de synthese par dossier, 'batch' pour un seul journal
+                     (folder.transit.bulk.log) avec le detail des differences en CSV
+        :return le journal en mode 'batch', sinon True
+        """
+        if values and all(isinstance(key, int) for key in values):
+            values_by_id = {folder_id: vals for folder_id, vals in values.items() if folder_id in self.ids}
+        else:
+            values_by_id = {folder_id: values for folder_id in self.ids}
+        if not values_by_id:
+            return True
+
+        written = set()
+        for vals in values_by_id.values():
+            written.update(vals)
+
+        # Une ecriture par jeu de valeurs distinct, sans preparation du suivi
+        groups = {}
+        for folder_id, vals in values_by_id.items():
+            key = tuple(sorted((fname, repr(value)) for fname, value in vals.items()))
+            groups.setdefault(key, (vals, []))[1].append(folder_id)
+
+        def apply():
+            NoTrack = self.with_context(transit_bulk_tracking=False, mail_notrack=True)
+            for vals, folder_ids in groups.values():
+                NoTrack.browse(folder_ids).write(vals)
+
+        return self.browse(list(values_by_id))._bulk_tracked_apply(written, apply, mode)
+
+    def _bulk_log_per_folder(self, changes):
+        """ Un seul message compact par dossier, sans lignes de suivi """
+        bodies = {}
+        for folder_id, lines in changes.items():
+            items = Markup('').join(
+                Markup('<li>%s : %s &#8594; %s</li>') % (self._fields[fname].string, old or '-', new or '-')
+                for fname, old, new in lines)
+            bodies[folder_id] = Markup('<p>%s</p><ul>%s</ul>') % (_('Mise a jour groupee'), items)
+        self.browse(list(bodies))._message_log_batch(bodies=bodies)
+
+    def _bulk_log_batch(self, changes):
+        """ Un journal pour tout le lot, avec les differences en piece jointe CSV """
+        names = {folder.id: folder.name for folder in self.browse(list(changes))}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['dossier_id', 'dossier', 'champ', 'ancienne_valeur', 'nouvelle_valeur'])
+        field_names = set()
+        change_count = 0
+        for folder_id, lines in changes.items():
+            for fname, old, new in lines:
+                writer.writerow([folder_id, names.get(folder_id, ''), fname, old, new])
+                field_names.add(self._fields[fname].string)
+                change_count += 1
+        # Journal systeme: ecrit en sudo, les utilisateurs n'y ont qu'un acces en lecture
+        now = fields.Datetime.now()
+        attachment = self.env['ir.attachment'].sudo().create({
+            'name': 'mise_a_jour_dossiers_%s.csv' % now.strftime('%Y%m%d_%H%M%S'),
+            'raw': buffer.getvalue().encode(),
+            'mimetype': 'text/csv',
+            'res_model': 'folder.transit.bulk.log',
+        })
+        log = self.env['folder.transit.bulk.log'].sudo().create({
+            'name': _('Mise a jour groupee de %s dossier(s)') % len(changes),
+            'date': now,
+            'folder_count': len(changes),
+            'change_count': change_count,
+            'field_names': ', '.join(sorted(field_names)),
+            'diff_attachment_id': attachment.id,
+        })
+        attachment.res_id = log.id
+        return log.sudo(False)
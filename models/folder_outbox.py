@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+from datetime import timedelta
+
+import requests
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+# Evenements publies pour les dossiers: (code, libelle, champ du dossier surveille)
+OUTBOX_EVENTS = [
+    ('stage', 'Changement d\'etape', 'stage_id'),
+    ('alerte', 'Changement d\'alerte', 'alerte'),
+    ('eta', 'Changement d\'ETA', 'date_arrival'),
+]
+
+# Nombre maximal de lots envoyes a un meme destinataire par passage du cron
+OUTBOX_MAX_BATCHES = 50
+
+# Delai de la premiere nouvelle tentative (secondes), double a chaque echec jusqu'a OUTBOX_RETRY_MAX_DELAY
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_RETRY_MAX_DELAY = 6 * 3600
+
+# Repertoire des destinataires fichier, fixe par l'administrateur (parametre systeme): sans lui, aucun
+# destinataire fichier ne peut etre livre
+OUTBOX_FILE_DIR_PARAM = 'inov_transit.outbox_file_dir'
+
+# Conservation des evenements livres (jours), surchargeable par inov_transit.outbox_retention_days
+OUTBOX_RETENTION_DAYS = 30
+
+
+class TransitFolderWebhook(models.Model):
+    _name = 'folder.transit.webhook'
+    _description = 'Destinataire des evenements des dossiers'
+    _order = 'name'
+
+    name = fields.Char("Nom", required=True)
+    active = fields.Boolean(default=True)
+    sink = fields.Selection([('http', 'Webhook HTTP'), ('file', 'Fichier local (JSON lines)')],
+                            string='Type', default='http', required=True)
+    url = fields.Char("URL")
+    token = fields.Char("Jeton (Bearer)", groups='inov_transit.group_transit_manager')
+    file_path = fields.Char("Fichier", help="Nom du fichier, cree dans le repertoire fixe par l'administrateur "
+                                            "(parametre systeme %s)" % OUTBOX_FILE_DIR_PARAM)
+    on_stage = fields.Boolean("Etapes", default=True)
+    on_alerte = fields.Boolean("Alertes", default=True)
+    on_eta = fields.Boolean("ETA", default=True)
+    batch_size = fields.Integer("Taille des lots", default=100)
+    timeout = fields.Integer("Delai d'attente (s)", default=10)
+    max_attempts = fields.Integer("Tentatives maximum", default=8)
+
+    # Metriques de livraison
+    pending_count = fields.Integer("En attente", compute='_compute_metrics')
+    dead_count = fields.Integer("Abandonnes", compute='_compute_metrics')
+    oldest_pending_date = fields.Datetime("Plus ancien en attente", compute='_compute_metrics')
+    lag_minutes = fields.Integer("Retard (min)", compute='_compute_metrics')
+    delivered_count = fields.Integer("Livres", readonly=True, default=0)
+    consecutive_failures = fields.Integer("Echecs consecutifs", readonly=True, default=0)
+    last_success_date = fields.Datetime("Derniere livraison", readonly=True)
+    last_error = fields.Text("Derniere erreur", readonly=True)
+
+    @api.constrains('sink', 'url', 'file_path')
+    def _check_target(self):
+        for webhook in self:
+            if webhook.sink == 'http' and not (webhook.url or '').startswith(('http://', 'https://')):
+                raise ValidationError(_("L'URL du webhook %s doit commencer par http:// ou https://.") % webhook.name)
+            if webhook.sink == 'file':
+                webhook._file_sink_path()
+
+    def _file_sink_path(self):
+        """ Chemin du fichier d'un destinataire fichier: un simple nom de fichier, dans le repertoire fixe par
+        l'administrateur. Les chemins, '..' et les liens sortant du repertoire sont refuses. """
+        self.ensure_one()
+        name = self.file_path or ''
+        if not name or name in ('.', '..') or os.path.basename(name) != name or (os.altsep and os.altsep in name):
+            raise ValidationError(_("Le fichier du destinataire %s doit etre un simple nom de fichier.") % self.name)
+        directory = self.env['ir.config_parameter'].sudo().get_param(OUTBOX_FILE_DIR_PARAM)
+        if not directory:
+            raise ValidationError(_("Aucun repertoire n'est autorise pour les destinataires fichier: "
+                                    "l'administrateur doit renseigner le parametre systeme %s.") % OUTBOX_FILE_DIR_PARAM)
+        directory = os.path.realpath(directory)
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.dirname(path) != directory:
+            raise ValidationError(_("Le fichier du destinataire %s sort du repertoire autorise.") % self.name)
+        return path
+
+    def _compute_metrics(self):
+        stats = {}
+        if self.ids:
+            self.env['folder.transit.outbox'].flush_model()
+            self.env.cr.execute("""
+                SELECT webhook_id,
+                       COUNT(*) FILTER (WHERE state = 'pending'),
+                       COUNT(*) FILTER (WHERE state = 'dead'),
+                       MIN(create_date) FILTER (WHERE state = 'pending')
+                  FROM folder_transit_outbox
+                 WHERE webhook_id IN %s AND state IN ('pending', 'dead')
+              GROUP BY webhook_id
+            """, [tuple(self.ids)])
+            stats = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        now = fields.Datetime.now()
+        for webhook in self:
+            pending, dead, oldest = stats.get(webhook.id, (0, 0, False))
+            webhook.pending_count = pending
+            webhook.dead_count = dead
+            webhook.oldest_pending_date = oldest
+            webhook.lag_minutes = oldest and int((now - oldest).total_seconds() // 60)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        webhooks = super(TransitFolderWebhook, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return webhooks
+
+    def write(self, values):
+        result = super(TransitFolderWebhook, self).write(values)
+        if set(values) & {'active', 'on_stage', 'on_alerte', 'on_eta'}:
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super(TransitFolderWebhook, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache()
+    def _get_subscriptions(self):
+        """ Destinataires actifs par type d'evenement: {code evenement: tuple(ids)} """
+        webhooks = self.sudo().search([])
+        return {
+            event: tuple(webhooks.filtered('on_%s' % event).ids)
+            for event, _label, _fname in OUTBOX_EVENTS
+        }
+
+    def action_retry_dead(self):
+        """ Remet en file les evenements abandonnes """
+        self.env['folder.transit.outbox'].search([
+            ('webhook_id', 'in', self.ids), ('state', '=', 'dead'),
+        ]).write({'state': 'pending', 'attempts': 0, 'next_attempt': fields.Datetime.now(), 'error': False})
+        self.env['folder.transit.outbox']._trigger_dispatch()
+        return True
+
+    def action_view_outbox(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('inov_transit.action_folder_transit_outbox')
+        action['domain'] = [('webhook_id', '=', self.id)]
+        return action
+
+    # ------------------------------------------------------------------
+    # Livraison
+    # ------------------------------------------------------------------
+
+    def _deliver(self, envelopes):
+        """ Envoie un lot d'evenements; leve une exception si le destinataire ne l'accepte pas """
+        self.ensure_one()
+        if self.sink == 'file':
+            with open(self._file_sink_path(), 'a', encoding='utf-8') as sink:
+                for envelope in envelopes:
+                    sink.write(json.dumps(envelope) + '\n')
+            return
+        headers = {'Content-Type': 'application/json'}
+        if self.sudo().token:
+            headers['Authorization'] = 'Bearer %s' % self.sudo().token
+        response = requests.post(self.url, data=json.dumps({'events': envelopes}), headers=headers,
+                                 timeout=self.timeout or 10)
+        response.raise_for_status()
+
+    @api.model
+    def get_stats(self):
+        """ Metriques de contre-pression de tous les destinataires, pour la supervision """
+        return {
+            webhook.name: {
+                'pending': webhook.pending_count,
+                'dead': webhook.dead_count,
+                'lag_minutes': webhook.lag_minutes,
+                'delivered': webhook.delivered_count,
+                'consecutive_failures': webhook.consecutive_failures,
+                'last_success': webhook.last_success_date,
+                'last_error': webhook.last_error,
+            }
+            for webhook in self.search([])
+        }
+
+
+class TransitFolderOutbox(models.Model):
+    _name = 'folder.transit.outbox'
+    _description = 'File des evenements des dossiers (outbox)'
+    _order = 'id desc'
+
+    webhook_id = fields.Many2one('folder.transit.webhook', string='Destinataire', required=True,
+                                 ondelete='cascade', index=True)
+    folder_id = fields.Many2one('folder.transit', string='Dossier', ondelete='set null', index=True)
+    event_type = fields.Selection([(code, label) for code, label, _fname in OUTBOX_EVENTS],
+                                  string='Evenement', required=True)
+    payload = fields.Text("Contenu", required=True)
+    state = fields.Selection([('pending', 'En attente'), ('done', 'Livre'), ('dead', 'Abandonne')],
+                             string='Etat', default='pending', required=True, index=True)
+    attempts = fields.Integer("Tentatives", default=0)
+    next_attempt = fields.Datetime("Prochaine tentative", default=fields.Datetime.now)
+    sent_date = fields.Datetime("Livre le")
+    error = fields.Text("Erreur")
+
+    def init(self):
+        # File des envois: evenements en attente par destinataire, dans l'ordre d'insertion
+        tools.create_index(self.env.cr, 'folder_transit_outbox_pending_index', self._table,
+                           ['webhook_id', 'folder_id', 'id'], where="state = 'pending'")
+
+    @api.model
+    def _enqueue(self, events):
+        """ Ecrit les evenements dans la transaction courante, une ligne par destinataire abonne
+        :param events: liste de (code evenement, dossier, contenu)
+        """
+        subscriptions = self.env['folder.transit.webhook']._get_subscriptions()
+        vals_list = [{
+            'webhook_id': webhook_id,
+            'folder_id': folder.id,
+            'event_type': event,
+            'payload': json.dumps(payload, default=str),
+        } for event, folder, payload in events for webhook_id in subscriptions.get(event, ())]
+        if not vals_list:
+            return
+        self.sudo().create(vals_list)
+        self._trigger_dispatch()
+
+    @api.model
+    def _trigger_dispatch(self):
+        """ Reveille le cron d'envoi une seule fois par transaction """
+        precommit = self.env.cr.precommit
+        if precommit.data.get('inov_transit.outbox_trigger'):
+            return
+        precommit.data['inov_transit.outbox_trigger'] = True
+
+        @precommit.add
+        def trigger():
+            cron = self.env.ref('inov_transit.ir_cron_dispatch_folder_outbox', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def _claim_batch(self, webhook):
+        """ Reserve le prochain lot d'un destinataire. Un evenement n'est pris que si aucun evenement
+        plus ancien du meme dossier n'est encore en attente: l'ordre est garanti par dossier, sans
+        bloquer les autres dossiers quand l'un d'eux est en nouvelle tentative.
+        """
+        self.env.cr.execute("""
+            SELECT o.id
+              FROM folder_transit_outbox o
+             WHERE o.webhook_id = %s
+               AND o.state = 'pending'
+               AND o.next_attempt <= NOW() AT TIME ZONE 'UTC'
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM folder_transit_outbox p
+                     WHERE p.webhook_id = o.webhook_id
+                       AND p.folder_id = o.folder_id
+                       AND p.state = 'pending'
+                       AND p.id < o.id)
+          ORDER BY o.id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [webhook.id, webhook.batch_size or 100])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _envelopes(self):
+        return [{
+            'id': event.id,
+            'type': event.event_type,
+            'folder_id': event.folder_id.id,
+            'occurred_at': fields.Datetime.to_string(event.create_date),
+            'data': json.loads(event.payload),
+        } for event in self]
+
+    def _mark_failed(self, webhook, error):
+        now = fields.Datetime.now()
+        max_attempts = webhook.max_attempts or 8
+        for event in self:
+            attempts = event.attempts + 1
+            delay = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_DELAY)
+            event.write({
+                'attempts': attempts,
+                'state': 'dead' if attempts >= max_attempts else 'pending',
+                'next_attempt': now + timedelta(seconds=delay),
+                'error': error,
+            })
+
+    @api.model
+    def _cron_dispatch_outbox(self, auto_commit=True):
+        """ Envoie les evenements en attente, par lots, a chaque destinataire actif.
+        Un destinataire en echec est laisse de cote jusqu'au prochain passage (contre-pression);
+        les evenements livres au-dela de la duree de conservation sont purges.
+        """
+        for webhook in self.env['folder.transit.webhook'].search([]):
+            for _i in range(OUTBOX_MAX_BATCHES):
+                events = self._claim_batch(webhook)
+                if not events:
+                    break
+                try:
+                    webhook._deliver(events._envelopes())
+                except Exception as e:
+                    if not auto_commit:
+                        raise
+                    _logger.warning("Echec de la livraison de %s evenement(s) a %s: %s",
+                                    len(events), webhook.name, e)
+                    events._mark_failed(webhook, str(e))
+                    webhook.write({
+                        'consecutive_failures': webhook.consecutive_failures + 1,
+                        'last_error': str(e),
+                    })
+                    self.env.cr.commit()
+                    break
+                now = fields.Datetime.now()
+                events.write({'state': 'done', 'sent_date': now, 'attempts': 0, 'error': False})
+                webhook.write({
+                    'delivered_count': webhook.delivered_count + len(events),
+                    'consecutive_failures': 0,
+                    'last_success_date': now,
+                })
+                if auto_commit:
+                    self.env.cr.commit()
+        retention = int(self.env['ir.config_parameter'].sudo().get_param(
+            'inov_transit.outbox_retention_days', OUTBOX_RETENTION_DAYS))
+        self.search([
+            ('state', '=', 'done'),
+            ('sent_date', '<', fields.Datetime.now() - timedelta(days=retention)),
+        ]).unlink()
+
+
+class TransitFolderEvents(models.Model):
+    _inherit = 'folder.transit'
+
+    def _outbox_stage_payload(self, stage):
+        return stage and {'id': stage.id, 'name': stage.name, 'number': stage.number} or None
+
+    def _outbox_base_payload(self):
+        return {'name': self.name, 'process': self.stages, 'customer_id': self.customer_id.id}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        folders = super(TransitFolderEvents, self).create(vals_list)
+        if self.env['folder.transit.webhook']._get_subscriptions()['stage']:
+            self.env['folder.transit.outbox']._enqueue([
+                ('stage', folder, dict(folder._outbox_base_payload(), old=None,
+                                       new=folder._outbox_stage_payload(folder.stage_id)))
+                for folder in folders
+            ])
+        return folders
+
+    def write(self, values):
+        watched = []
+        if 'stage_id' in values:
+            watched.append('stage')
+        if 'date_arrival' in values:
+            watched.append('eta')
+        subscriptions = self.env['folder.transit.webhook']._get_subscriptions()
+        watched = [event for event in watched if subscriptions[event]]
+        if not watched:
+            return super(TransitFolderEvents, self).write(values)
+
+        before = {folder.id: (folder.stage_id, folder.date_arrival) for folder in self}
+        result = super(TransitFolderEvents, self).write(values)
+        events = []
+        for folder in self:
+            old_stage, old_eta = before[folder.id]
+            if 'stage' in watched and folder.stage_id != old_stage:
+                events.append(('stage', folder, dict(
+                    folder._outbox_base_payload(),
+                    old=folder._outbox_stage_payload(old_stage),
+                    new=folder._outbox_stage_payload(folder.stage_id))))
+            if 'eta' in watched and folder.date_arrival != old_eta:
+                events.append(('eta', folder, dict(
+                    folder._outbox_base_payload(), old=old_eta, new=folder.date_arrival)))
+        self.env['folder.transit.outbox']._enqueue(events)
+        return result
+
+    def _notify_alerte_change(self, old_alerte, new_alerte):
+        """ Publie aussi le changement d'alerte (calcul sur l'ETA et cron de mise a jour des alertes) """
+        if self.id and old_alerte != new_alerte:
+            self.env['folder.transit.outbox']._enqueue([
+                ('alerte', self, dict(self._outbox_base_payload(), old=old_alerte, new=new_alerte)),
+            ])
+        return super(TransitFolderEvents, self)._notify_alerte_change(old_alerte, new_alerte)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import zipfile
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import pdf, split_every
+
+_logger = logging.getLogger(__name__)
+
+# Nombre de factures rendues par un worker en un seul appel a wkhtmltopdf
+PRINT_CHUNK_SIZE = 20
+
+# Crons workers d'impression, declenches ensemble pour traiter les lots en parallele
+PRINT_WORKER_CRONS = ('inov_transit.ir_cron_transit_invoice_print', 'inov_transit.ir_cron_transit_invoice_print_2')
+
+
+class TransitInvoicePrint(models.Model):
+    _name = 'transit.invoice.print'
+    _description = 'Impression groupee des factures transit'
+    _order = 'id desc'
+
+    name = fields.Char("Reference", required=True, readonly=True, default=lambda self: _('New'))
+    user_id = fields.Many2one('res.users', string='Demande Par', readonly=True,
+                              default=lambda self: self.env.user)
+    state = fields.Selection([('draft', 'Brouillon'), ('running', 'En cours'), ('done', 'Termine'),
+                              ('failed', 'Echec')], string='Etat', default='draft', readonly=True)
+    output_format = fields.Selection([('pdf', 'PDF fusionne'), ('zip', 'Archive ZIP')], string='Format',
+                                     default='pdf', required=True)
+    invoice_ids = fields.Many2many('account.move', string='Factures', readonly=True)
+    chunk_ids = fields.One2many('transit.invoice.print.chunk', 'job_id', string='Lots', readonly=True)
+    invoice_count = fields.Integer("Nombre de Factures", compute='_compute_progress')
+    done_count = fields.Integer("Factures Imprimees", compute='_compute_progress')
+    progress = fields.Float("Progression", compute='_compute_progress')
+    result_attachment_id = fields.Many2one('ir.attachment', string='Fichier', readonly=True, copy=False)
+    error = fields.Text("Erreur", readonly=True)
+
+    @api.depends('chunk_ids.state', 'chunk_ids.invoice_ids')
+    def _compute_progress(self):
+        for job in self:
+            job.invoice_count = sum(len(chunk.invoice_ids) for chunk in job.chunk_ids)
+            job.done_count = sum(len(chunk.invoice_ids) for chunk in job.chunk_ids if chunk.state == 'done')
+            job.progress = job.invoice_count and job.done_count * 100.0 / job.invoice_count
+
+    @api.model
+    def create_from_invoices(self, invoices, output_format='pdf'):
+        """ Cree un travail d'impression regroupant les factures par rapport, en lots de PRINT_CHUNK_SIZE """
+        if not invoices:
+            raise UserError(_("Aucune facture a imprimer."))
+        invoices.filtered(lambda inv: not inv.sent).write({'sent': True})
+        invoices_by_report = {}
+        for invoice in invoices:
+            invoices_by_report.setdefault(invoice._get_transit_report_xmlid(), []).append(invoice.id)
+        chunks = []
+        sequence = 0
+        for report_xmlid, invoice_ids in invoices_by_report.items():
+            for chunk_ids in split_every(PRINT_CHUNK_SIZE, invoice_ids):
+                sequence += 1
+                chunks.append((0, 0, {
+                    'sequence': sequence,
+                    'report_xmlid': report_xmlid,
+                    'invoice_ids': [(6, 0, list(chunk_ids))],
+                }))
+        job = self.create({
+            'name': self.env['ir.sequence'].next_by_code('transit.invoice.print') or _('New'),
+            'output_format': output_format,
+            'invoice_ids': [(6, 0, invoices.ids)],
+            'chunk_ids': chunks,
+            'state': 'running',
+        })
+        job._trigger_workers()
+        return job
+
+    def action_view_job(self):
+        self.ensure_one()
+        return {
+            'name': _('Impression Groupee'),
+            'type': 'ir.actions.act_window',
+            'view_mode': 'form',
+            'res_model': self._name,
+            'res_id': self.id,
+            'target': 'current',
+        }
+
+    def action_download(self):
+        self.ensure_one()
+        if not self.result_attachment_id:
+            raise UserError(_("L'impression n'est pas encore terminee."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % self.result_attachment_id.id,
+            'target': 'self',
+        }
+
+    def action_retry(self):
+        """ Remet en file les lots en echec """
+        self.chunk_ids.filtered(lambda chunk: chunk.state == 'failed').write({'state': 'pending', 'error': False})
+        self.write({'state': 'running', 'error': False})
+        self._trigger_workers()
+        return True
+
+    @api.model
+    def _trigger_workers(self):
+        """ Reveille tous les workers: chacun reserve ses lots (SKIP LOCKED) jusqu'a epuisement de la file """
+        for xmlid in PRINT_WORKER_CRONS:
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def _cron_process_print_jobs(self, auto_commit=True):
+        """ Worker d'impression: traite les lots en attente jusqu'a epuisement de la file.
+        Les lots sont reserves avec FOR UPDATE SKIP LOCKED, plusieurs workers (crons) peuvent
+        donc tourner en parallele sur les memes travaux.
+        """
+        Chunk = self.env['transit.invoice.print.chunk']
+        while True:
+            chunk = Chunk._claim_next()
+            if not chunk:
+                break
+            try:
+                chunk._render()
+            except Exception as e:
+                if not auto_commit:
+                    raise
+                _logger.exception("Echec de l'impression du lot %s", chunk.id)
+                self.env.cr.rollback()
+                chunk.write({'state': 'failed', 'error': str(e)})
+            if auto_commit:
+                self.env.cr.commit()
+        for job in self.search([('state', '=', 'running')]):
+            job._finalize()
+            if auto_commit:
+                self.env.cr.commit()
+
+    def _finalize(self):
+        """ Assemble le fichier final quand tous les lots du travail sont termines """
+        self.ensure_one()
+        self.env.cr.execute("SELECT state FROM transit_invoice_print WHERE id = %s FOR UPDATE", [self.id])
+        row = self.env.cr.fetchone()
+        self.invalidate_recordset()
+        self.chunk_ids.invalidate_recordset(['state'])
+        if not row or row[0] != 'running' or any(c.state in ('pending', 'running') for c in self.chunk_ids):
+            return False
+        if any(chunk.state == 'failed' for chunk in self.chunk_ids):
+            self.write({
+                'state': 'failed',
+                'error': '\n'.join(chunk.error for chunk in self.chunk_ids if chunk.error),
+            })
+            return False
+        attachments = self.chunk_ids.sorted('sequence').mapped('attachment_ids')
+        if self.output_format == 'zip':
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for attachment in attachments:
+                    archive.writestr(attachment.name, attachment.raw)
+            content, filename, mimetype = buffer.getvalue(), '%s.zip' % self.name, 'application/zip'
+        else:
+            content = pdf.merge_pdf([attachment.raw for attachment in attachments])
+            filename, mimetype = '%s.pdf' % self.name, 'application/pdf'
+        result = self.env['ir.attachment'].create({
+            'name': filename.replace('/', '_'),
+            'raw': content,
+            'mimetype': mimetype,
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        self.write({'state': 'done', 'result_attachment_id': result.id})
+        return True
+
+
+class TransitInvoicePrintChunk(models.Model):
+    _name = 'transit.invoice.print.chunk'
+    _description = "Lot d'impression de factures transit"
+    _order = 'job_id, sequence'
+
+    job_id = fields.Many2one('transit.invoice.print', string='Impression', required=True, ondelete='cascade',
+                             index=True)
+    sequence = fields.Integer("Sequence")
+    report_xmlid = fields.Char("Rapport", required=True)
+    invoice_ids = fields.Many2many('account.move', string='Factures')
+    state = fields.Selection([('pending', 'En attente'), ('running', 'En cours'), ('done', 'Termine'),
+                              ('failed', 'Echec')], string='Etat', default='pending', index=True)
+    attachment_ids = fields.Many2many('ir.attachment', string='PDF')
+    error = fields.Text("Erreur")
+
+    @api.model
+    def _claim_next(self):
+        """ Reserve le prochain lot en attente, en ignorant ceux deja pris par un autre worker """
+        self.env.cr.execute("""
+            SELECT id
+              FROM transit_invoice_print_chunk
+             WHERE state = 'pending'
+          ORDER BY job_id, sequence
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        if not row:
+            return self.browse()
+        chunk = self.browse(row[0])
+        chunk.state = 'running'
+        return chunk
+
+    def _render(self):
+        """ Rend les factures du lot en un seul appel au rapport et stocke un PDF par facture """
+        self.ensure_one()
+        Attachment = self.env['ir.attachment']
+        invoices = self.invoice_ids
+        streams = self.env['ir.actions.report']._render_qweb_pdf_prepare_streams(
+            self.report_xmlid, None, res_ids=invoices.ids)
+        attachments = Attachment
+        for invoice in invoices:
+            if invoice.id not in streams:
+                continue
+            attachments |= Attachment.create({
+                'name': '%s.pdf' % (invoice.name or invoice.id).replace('/', '_'),
+                'raw': streams[invoice.id]['stream'].getvalue(),
+                'mimetype': 'application/pdf',
+                'res_model': self.job_id._name,
+                'res_id': self.job_id.id,
+            })
+        if not attachments:
+            # Le rapport n'a pas pu etre decoupe par facture: un seul PDF pour le lot
+            stream = next(iter(streams.values()))['stream']
+            attachments = Attachment.create({
+                'name': '%s-%s.pdf' % (self.job_id.name.replace('/', '_'), self.sequence),
+                'raw': stream.getvalue(),
+                'mimetype': 'application/pdf',
+                'res_model': self.job_id._name,
+                'res_id': self.job_id.id,
+            })
+        for stream_data in streams.values():
+            stream_data['stream'].close()
+        self.write({'state': 'done', 'attachment_ids': [(6, 0, attachments.ids)]})
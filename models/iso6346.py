@@ -0,0 +1,64 @@
+"""
+Numeros de conteneurs ISO 6346: normalisation, cle de controle et extraction depuis un texte libre.
+
+Les valeurs ponderees de chaque caractere a chaque position sont precalculees: valider un numero revient
+a dix lectures de table et une somme, ce qui permet de controler des milliers de numeros en un appel.
+"""
+
+import re
+
+# Valeurs des lettres (A=10, les multiples de 11 sont sautes) et des chiffres
+CHAR_VALUES = {}
+_value = 10
+for _letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+    if _value % 11 == 0:
+        _value += 1
+    CHAR_VALUES[_letter] = _value
+    _value += 1
+CHAR_VALUES.update({str(digit): digit for digit in range(10)})
+
+# Valeur ponderee (valeur * 2^position) de chaque caractere aux dix positions controlees
+POSITION_VALUES = tuple({char: value * 2 ** position for char, value in CHAR_VALUES.items()} for position in range(10))
+
+# Proprietaire (3 lettres), categorie (U, J, Z ou R), numero de serie (6 chiffres), cle (1 chiffre)
+CONTAINER_RE = re.compile(r'^[A-Z]{3}[UJZR][0-9]{7}$')
+CONTAINER_SEARCH_RE = re.compile(r'\b([A-Z]{3}[UJZR])[\s.]?([0-9]{6})[\s.-]?([0-9])\b')
+NON_ALNUM_RE = re.compile(r'[^A-Z0-9]')
+
+
+def normalize(number):
+    """ Numero en majuscules, sans espaces ni separateurs """
+    if not number:
+        return ''
+    return NON_ALNUM_RE.sub('', number.upper())
+
+
+def check_digit(code):
+    """ Cle de controle des dix premiers caracteres d'un numero normalise """
+    total = 0
+    for position in range(10):
+        total += POSITION_VALUES[position][code[position]]
+    return total % 11 % 10
+
+
+def is_valid(number):
+    """ Vrai si le numero (normalise) respecte le format ISO 6346 et sa cle de controle """
+    return bool(CONTAINER_RE.match(number)) and check_digit(number) == int(number[10])
+
+
+def validate_batch(numbers):
+    """ Controle en masse: chaque numero distinct n'est normalise et verifie qu'une fois
+    :return {numero saisi: (numero normalise, valide)}
+    """
+    result = {}
+    for number in numbers:
+        if number not in result:
+            normalized = normalize(number)
+            result[number] = (normalized, is_valid(normalized))
+    return result
+
+
+def extract(text):
+    """ Numeros de conteneurs (normalises) trouves dans une ligne de texte, dans leur ordre d'apparition """
+    return [''.join(match) for match in CONTAINER_SEARCH_RE.findall(text.upper())]
+
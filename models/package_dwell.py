@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Dates des conteneurs dont la modification relance le calcul des durees de sejour
+DWELL_DATE_FIELDS = ('date_receipt', 'date_output', 'date_delivered', 'date_remove', 'date_return', 'package_type_id',
+                     'transit_id')
+
+
+class ContainerDemurrageTier(models.Model):
+    _name = 'container.demurrage.tier'
+    _description = 'Tranches de franchise et de surestaries des conteneurs'
+    _order = 'phase, package_type_id, day_from'
+
+    name = fields.Char("Libelle", required=True)
+    active = fields.Boolean(default=True)
+    phase = fields.Selection([('port', 'Sejour au port'), ('customer', 'Detention client')], string='Periode',
+                             required=True, default='port',
+                             help="Sejour au port: de la reception a la sortie. "
+                                  "Detention client: de la sortie au retour du conteneur vide.")
+    package_type_id = fields.Many2one('package.transit', string='Type de Conteneur',
+                                      help="Vide: tranche appliquee aux types sans tranche specifique")
+    day_from = fields.Integer("Du jour", required=True, default=1)
+    day_to = fields.Integer("Au jour", help="0: sans limite")
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 default=lambda self: self.env.company)
+    currency_id = fields.Many2one('res.currency', related='company_id.currency_id', readonly=True)
+    daily_rate = fields.Monetary("Tarif Journalier", currency_field='currency_id',
+                                 help="0 pour une tranche de franchise")
+
+
+class PackageFolderDwell(models.Model):
+    _inherit = 'package.folders'
+
+    port_days = fields.Integer("Jours au Port", readonly=True)
+    customer_days = fields.Integer("Jours chez le Client", readonly=True)
+    dwell_days = fields.Integer("Duree Totale (jours)", readonly=True)
+    demurrage_amount = fields.Float("Surestaries Estimees", readonly=True, digits='Account')
+    dwell_date = fields.Date("Calcule le", readonly=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        packages = super(PackageFolderDwell, self).create(vals_list)
+        self._compute_dwell(packages.ids)
+        return packages
+
+    def write(self, values):
+        # Un conteneur deplace quitte les cumuls de son ancien dossier
+        old_folder_ids = set(self.mapped('transit_id').ids) if 'transit_id' in values else set()
+        result = super(PackageFolderDwell, self).write(values)
+        if any(fname in values for fname in DWELL_DATE_FIELDS):
+            self._compute_dwell(self.ids)
+        if old_folder_ids:
+            self.env['folder.transit']._compute_dwell_rollups(list(old_folder_ids - set(self.mapped('transit_id').ids)))
+        return result
+
+    def unlink(self):
+        folder_ids = self.mapped('transit_id').ids
+        result = super(PackageFolderDwell, self).unlink()
+        self.env.flush_all()
+        self.env['folder.transit']._compute_dwell_rollups(folder_ids)
+        return result
+
+    @api.model
+    def _compute_dwell(self, package_ids=None):
+        """ Recalcule en SQL les durees de sejour et les surestaries estimees des conteneurs, puis les cumuls
+        de leurs dossiers. Sans package_ids: tous les conteneurs non retournes des dossiers actifs, et ceux
+        jamais calcules.
+        :return nombre de conteneurs recalcules
+        """
+        if package_ids is not None and not package_ids:
+            return 0
+        self.env.flush_all()
+        today = fields.Date.context_today(self)
+        if package_ids is None:
+            scope = "f.active AND (p.date_return IS NULL OR p.dwell_date IS NULL)"
+            params = {'today': today}
+        else:
+            scope = "p.id = ANY(%(package_ids)s)"
+            params = {'today': today, 'package_ids': list(package_ids)}
+        self.env.cr.execute("""
+            WITH dwell AS (
+                SELECT p.id, p.package_type_id,
+                       CASE WHEN p.date_receipt IS NULL THEN 0
+                            ELSE GREATEST(COALESCE(p.date_output, %(today)s) - p.date_receipt, 0) END AS port_days,
+                       CASE WHEN p.date_output IS NULL THEN 0
+                            ELSE GREATEST(COALESCE(p.date_return, %(today)s) - p.date_output, 0) END AS customer_days
+                  FROM package_folders p
+                  JOIN folder_transit f ON f.id = p.transit_id
+                 WHERE {scope}
+            ), cost AS (
+                SELECT d.id,
+                       COALESCE(SUM(
+                           GREATEST(LEAST(CASE WHEN t.phase = 'port' THEN d.port_days ELSE d.customer_days END,
+                                          COALESCE(NULLIF(t.day_to, 0), 2147483647)) - t.day_from + 1, 0)
+                           * t.daily_rate), 0) AS amount
+                  FROM dwell d
+             LEFT JOIN container_demurrage_tier t
+                    ON t.active
+                   AND (t.package_type_id = d.package_type_id
+                        OR (t.package_type_id IS NULL AND NOT EXISTS (
+                            SELECT 1 FROM container_demurrage_tier s
+                             WHERE s.active AND s.phase = t.phase AND s.package_type_id = d.package_type_id)))
+              GROUP BY d.id
+            )
+            UPDATE package_folders p
+               SET port_days = d.port_days,
+                   customer_days = d.customer_days,
+                   dwell_days = d.port_days + d.customer_days,
+                   demurrage_amount = c.amount,
+                   dwell_date = %(today)s
+              FROM dwell d
+              JOIN cost c ON c.id = d.id
+             WHERE p.id = d.id
+         RETURNING p.transit_id
+        """.format(scope=scope), params)
+        rows = self.env.cr.fetchall()
+        folder_ids = list({row[0] for row in rows if row[0]})
+        self.invalidate_model(['port_days', 'customer_days', 'dwell_days', 'demurrage_amount', 'dwell_date'])
+        self.env['folder.transit']._compute_dwell_rollups(folder_ids)
+        return len(rows)
+
+    @api.model
+    def _cron_compute_dwell(self):
+        count = self._compute_dwell()
+        _logger.info("Durees de sejour des conteneurs: %s conteneur(s) recalcule(s)", count)
+        return count
+
+
+class TransitFolderDwell(models.Model):
+    _inherit = 'folder.transit'
+
+    company_currency_id = fields.Many2one('res.currency', related='company_id.currency_id', readonly=True)
+    dwell_days_fcl20 = fields.Integer("Jours Conteneurs 20'", readonly=True)
+    dwell_days_fcl40 = fields.Integer("Jours Conteneurs 40'", readonly=True)
+    max_dwell_days = fields.Integer("Sejour Maximum (jours)", readonly=True, index=True)
+    demurrage_amount = fields.Monetary("Surestaries Estimees", currency_field='company_currency_id', readonly=True,
+                                       index=True)
+
+    @api.model
+    def _compute_dwell_rollups(self, folder_ids):
+        """ Cumuls par dossier des durees et surestaries de ses conteneurs, en une requete """
+        if not folder_ids:
+            return
+        type_20 = self.env.ref('inov_transit.package_20', raise_if_not_found=False)
+        type_40 = self.env.ref('inov_transit.package_40', raise_if_not_found=False)
+        self.env.cr.execute("""
+            UPDATE folder_transit f
+               SET dwell_days_fcl20 = r.days_20,
+                   dwell_days_fcl40 = r.days_40,
+                   max_dwell_days = r.max_days,
+                   demurrage_amount = r.amount
+              FROM (
+                    SELECT f2.id AS folder_id,
+                           COALESCE(SUM(p.dwell_days) FILTER (WHERE p.package_type_id = %(type_20)s), 0) AS days_20,
+                           COALESCE(SUM(p.dwell_days) FILTER (WHERE p.package_type_id = %(type_40)s), 0) AS days_40,
+                           COALESCE(MAX(p.dwell_days), 0) AS max_days,
+                           COALESCE(SUM(p.demurrage_amount), 0) AS amount
+                      FROM folder_transit f2
+                 LEFT JOIN package_folders p ON p.transit_id = f2.id
+                     WHERE f2.id = ANY(%(folder_ids)s)
+                  GROUP BY f2.id
+                   ) r
+             WHERE f.id = r.folder_id
+        """, {'type_20': type_20.id if type_20 else None, 'type_40': type_40.id if type_40 else None,
+              'folder_ids': list(folder_ids)})
+        self.invalidate_model(['dwell_days_fcl20', 'dwell_days_fcl40', 'max_dwell_days', 'demurrage_amount'])
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import io
+import logging
+import threading
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Rapports de facture transit dont les PDF sont mis en cache
+TRANSIT_CACHED_REPORTS = {
+    'inov_transit.account_invoice_folder_simple',
+    'inov_transit.account_invoice_folder_sorepco',
+    'inov_transit.account_invoice_folder_placam',
+    'inov_transit.account_invoice_folder_cimaf',
+}
+
+# Taille maximale par defaut du cache (octets), surchargeable par le parametre inov_transit.pdf_cache_max_size
+PDF_CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+# Compteurs de succes / echecs du cache, propres a chaque processus
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _count(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+class TransitInvoicePdfCache(models.Model):
+    _name = 'transit.invoice.pdf.cache'
+    _description = 'Cache des PDF de factures transit'
+    _order = 'last_used desc'
+
+    invoice_id = fields.Many2one('account.move', string='Facture', required=True, ondelete='cascade')
+    report_name = fields.Char("Rapport", required=True)
+    fingerprint = fields.Char("Empreinte", required=True)
+    pdf = fields.Binary("PDF", attachment=True)
+    file_size = fields.Integer("Taille (octets)")
+    hit_count = fields.Integer("Utilisations", default=0)
+    last_used = fields.Datetime("Derniere Utilisation", default=fields.Datetime.now, index=True)
+
+    _sql_constraints = [
+        ('invoice_report_uniq', 'unique(invoice_id, report_name)',
+         'Une seule entree de cache par facture et par rapport.'),
+    ]
+
+    @api.model
+    def _get_fingerprints(self, invoice_ids):
+        """ Empreinte des donnees lues par les rapports: dates de modification de la facture, de ses
+        lignes, du client, du dossier lie et de ses debours
+        :return {invoice_id: empreinte}
+        """
+        if not invoice_ids:
+            return {}
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT m.id, m.write_date,
+                   (SELECT MAX(l.write_date) FROM account_move_line l WHERE l.move_id = m.id),
+                   p.write_date, f.write_date,
+                   (SELECT MAX(d.write_date) FROM debour_transit d WHERE d.transit_id = f.id)
+              FROM account_move m
+         LEFT JOIN res_partner p ON p.id = m.partner_id
+         LEFT JOIN folder_transit f ON f.id = m.transit_id
+             WHERE m.id IN %s
+        """, [tuple(invoice_ids)])
+        return {
+            row[0]: hashlib.sha1(repr(row).encode()).hexdigest()
+            for row in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _lookup(self, report_name, invoices):
+        """ PDF en cache encore valides pour les factures validees
+        :return ({invoice_id: pdf en octets}, {invoice_id: empreinte})
+        """
+        posted = invoices.filtered(lambda inv: inv.state == 'posted')
+        fingerprints = self._get_fingerprints(posted.ids)
+        if not fingerprints:
+            return {}, fingerprints
+        entries = self.sudo().search([
+            ('invoice_id', 'in', list(fingerprints)),
+            ('report_name', '=', report_name),
+        ])
+        hits = {}
+        for entry in entries:
+            if entry.fingerprint == fingerprints[entry.invoice_id.id] and entry.pdf:
+                hits[entry.invoice_id.id] = base64.b64decode(entry.pdf)
+        if hits:
+            self.env.cr.execute("""
+                UPDATE transit_invoice_pdf_cache
+                   SET hit_count = hit_count + 1, last_used = NOW() AT TIME ZONE 'UTC'
+                 WHERE report_name = %s AND invoice_id IN %s
+            """, [report_name, tuple(hits)])
+        return hits, fingerprints
+
+    @api.model
+    def _store(self, report_name, pdf_by_invoice, fingerprints):
+        """ Enregistre (ou remplace) les PDF rendus puis applique la limite de taille.
+        Le cache n'est qu'une optimisation: un conflit avec un rendu concurrent de la meme facture
+        (contrainte unique) ou toute autre erreur est ignore et n'interrompt jamais l'impression.
+        """
+        pdf_by_invoice = {inv_id: content for inv_id, content in pdf_by_invoice.items() if inv_id in fingerprints}
+        if not pdf_by_invoice:
+            return
+        try:
+            with self.env.cr.savepoint():
+                self._store_entries(report_name, pdf_by_invoice, fingerprints)
+        except Exception:
+            # Rejoue facture par facture: seules les entrees en conflit sont abandonnees
+            for invoice_id, content in pdf_by_invoice.items():
+                try:
+                    with self.env.cr.savepoint():
+                        self._store_entries(report_name, {invoice_id: content}, fingerprints)
+                except Exception as e:
+                    _logger.info("Cache PDF transit: facture %s non mise en cache (%s)", invoice_id, e)
+        try:
+            with self.env.cr.savepoint():
+                self.sudo()._evict()
+        except Exception as e:
+            _logger.info("Cache PDF transit: eviction reportee (%s)", e)
+
+    @api.model
+    def _store_entries(self, report_name, pdf_by_invoice, fingerprints):
+        cache = self.sudo()
+        cache.search([('invoice_id', 'in', list(pdf_by_invoice)), ('report_name', '=', report_name)]).unlink()
+        cache.create([{
+            'invoice_id': invoice_id,
+            'report_name': report_name,
+            'fingerprint': fingerprints[invoice_id],
+            'pdf': base64.b64encode(content),
+            'file_size': len(content),
+        } for invoice_id, content in pdf_by_invoice.items()])
+        cache.flush_model()
+
+    @api.model
+    def _evict(self):
+        """ Supprime les entrees les moins recemment utilisees au-dela de la taille maximale """
+        max_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'inov_transit.pdf_cache_max_size', PDF_CACHE_MAX_SIZE))
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM (
+                SELECT id, SUM(file_size) OVER (ORDER BY last_used DESC, id DESC) AS total
+                  FROM transit_invoice_pdf_cache
+            ) t
+             WHERE t.total > %s
+        """, [max_size])
+        evicted = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if evicted:
+            _logger.info("Cache PDF transit: %s entree(s) evincee(s)", len(evicted))
+            evicted.unlink()
+
+    @api.model
+    def get_stats(self):
+        """ Compteurs de succes / echecs du processus courant et occupation du cache """
+        self.env.cr.execute("SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM transit_invoice_pdf_cache")
+        count, size = self.env.cr.fetchone()
+        with _stats_lock:
+            stats = dict(_stats)
+        total = stats['hits'] + stats['misses']
+        stats.update({
+            'hit_ratio': total and stats['hits'] * 100.0 / total,
+            'entries': count,
+            'size': size,
+        })
+        return stats
+
+    @api.model
+    def action_clear_cache(self):
+        self.sudo().search([]).unlink()
+        return True
+
+
+class TransitReportCache(models.Model):
+    _inherit = 'ir.actions.report'
+
+    def _render_qweb_pdf_prepare_streams(self, report_ref, data, res_ids=None):
+        report = self._get_report(report_ref)
+        if report.report_name not in TRANSIT_CACHED_REPORTS or not res_ids or data:
+            return super(TransitReportCache, self)._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+
+        Cache = self.env['transit.invoice.pdf.cache']
+        invoices = self.env['account.move'].browse(res_ids)
+        hits, fingerprints = Cache._lookup(report.report_name, invoices)
+        misses = [res_id for res_id in res_ids if res_id not in hits]
+        _count('hits', len(hits))
+        _count('misses', len(misses))
+
+        rendered = {}
+        if misses:
+            rendered = super(TransitReportCache, self)._render_qweb_pdf_prepare_streams(
+                report_ref, data, res_ids=misses)
+            if False in rendered:
+                # Le PDF n'a pas pu etre decoupe par facture: pas de mise en cache possible
+                if not hits:
+                    return rendered
+                return super(TransitReportCache, self)._render_qweb_pdf_prepare_streams(
+                    report_ref, data, res_ids=res_ids)
+            Cache._store(report.report_name, {
+                res_id: values['stream'].getvalue()
+                for res_id, values in rendered.items() if values.get('stream')
+            }, fingerprints)
+
+        streams = {}
+        for res_id in res_ids:
+            if res_id in hits:
+                streams[res_id] = {'stream': io.BytesIO(hits[res_id]), 'attachment': None}
+            elif res_id in rendered:
+                streams[res_id] = rendered[res_id]
+        return streams
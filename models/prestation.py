@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from datetime import datetime, timedelta, date
 from ast import literal_eval
 
@@ -86,6 +86,55 @@ class Prestations(models.Model):
     caution = fields.Float("Caution", required=True, default=0.0)
     taux = fields.Float("Taux", required=True, default=0.0)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        result = super(Prestations, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return result
+
+    def write(self, values):
+        result = super(Prestations, self).write(values)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super(Prestations, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache()
+    def _get_prestation_map(self):
+        """ Table produit -> prestation partagee par le registre, invalidee a chaque modification
+        :return {product_id: {type_service: {'id', 'type_service', 'taux', 'caution'}}}
+        """
+        prestation_map = {}
+        for prestation in self.sudo().search_read([], ['product_id', 'type_service', 'taux', 'caution'], order='id'):
+            services = prestation_map.setdefault(prestation['product_id'][0], {})
+            services.setdefault(prestation['type_service'], {
+                'id': prestation['id'],
+                'type_service': prestation['type_service'],
+                'taux': prestation['taux'],
+                'caution': prestation['caution'],
+            })
+        return prestation_map
+
+    @api.model
+    def _is_prestation_product(self, product_id):
+        """ Vrai si le produit porte au moins une prestation, quel que soit son type de service (meme vide):
+        ses lignes de facture sont des charges variables, les autres des charges fixes """
+        return product_id in self._get_prestation_map()
+
+    @api.model
+    def _get_product_prestation(self, product_id, type_service=None):
+        """ Prestation (fixe en priorite, sinon variable) du produit, ou False """
+        services = self._get_prestation_map().get(product_id)
+        if not services:
+            return False
+        if type_service:
+            return services.get(type_service, False)
+        return services.get('fixed') or services.get('changed') or False
+
 
 class InvoiceProductTransit(models.Model):
     _name = 'invoice.transit'
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+
+class TransitInvoiceReport(models.AbstractModel):
+    _name = 'transit.invoice.report'
+    _description = 'Base des rapports de facture transit'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        """ Precalcule en une passe, pour toutes les factures imprimees, la repartition des lignes
+        (prestations / autres charges) et les montants en lettres, lus par les templates """
+        docs = self.env['account.move'].browse(docids)
+        return {
+            'doc_ids': docids,
+            'doc_model': 'account.move',
+            'docs': docs,
+            'data': data,
+            'line_partitions': docs._get_invoice_line_partitions(),
+            'amount_letters': docs._get_amount_letters(),
+        }
+
+
+class TransitInvoiceCimafReport(models.AbstractModel):
+    _name = 'report.inov_transit.account_invoice_folder_cimaf'
+    _inherit = 'transit.invoice.report'
+    _description = 'Facture CIMAF'
+
+
+class TransitInvoiceSimpleReport(models.AbstractModel):
+    _name = 'report.inov_transit.account_invoice_folder_simple'
+    _inherit = 'transit.invoice.report'
+    _description = 'Facture Simple'
+
+
+class TransitInvoicePlacamReport(models.AbstractModel):
+    _name = 'report.inov_transit.account_invoice_folder_placam'
+    _inherit = 'transit.invoice.report'
+    _description = 'Facture PLACAM'
+
+
+class TransitInvoiceSorepcoReport(models.AbstractModel):
+    _name = 'report.inov_transit.account_invoice_folder_sorepco'
+    _inherit = 'transit.invoice.report'
+    _description = 'Facture SOREPCO'
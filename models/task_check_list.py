@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools import html2plaintext, clean_context
 
@@ -19,6 +19,22 @@ class TaskChecklist(models.Model):
         string='Etapes',
         )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        result = super(TaskChecklist, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return result
+
+    def write(self, values):
+        result = super(TaskChecklist, self).write(values)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super(TaskChecklist, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
 
 class TaskActivityTransit(models.Model):
     _inherit = 'mail.activity'
@@ -27,35 +43,60 @@ class TaskActivityTransit(models.Model):
         'folder.transit',
         string='Dossier',
         compute='compute_folder_transit_field',
+        store=True,
+        index=True,
     )
 
     stages = fields.Selection([('transit', 'Dedouanement'), ('accone', 'Acconage'), ('ship', 'Shipping')],
                               string="Processus")
 
 
-    @api.depends('res_id')
+    @api.depends('res_model', 'res_id')
     def compute_folder_transit_field(self):
+        """ Dossier lie, uniquement pour les activites portant sur folder.transit """
+        folder_activities = self.filtered(lambda act: act.res_model == 'folder.transit' and act.res_id)
+        existing_ids = set(self.env['folder.transit'].browse(set(folder_activities.mapped('res_id'))).exists().ids)
         for record in self:
-            if record.res_id:
-                record.model_transit_id = self.env['folder.transit'].browse(record.res_id).id
+            if record in folder_activities and record.res_id in existing_ids:
+                record.model_transit_id = record.res_id
+            else:
+                record.model_transit_id = False
 
-    
-    
-    def action_feedback(self, feedback=False, attachment_ids=None):
-        for activity in self:
-            vals = {
-                    'name': activity.activity_type_id.name,
-                    'responsible_id': activity.user_id.name,
-                    'date_start': activity.date_deadline,
-                    'date_dealine': fields.Date.today(),
-                    'folder_id': activity.res_id,
-                }
-            self.env['task.checklist'].create(vals)
-        messages, _next_activities = self.with_context(
+    def _prepare_checklist_values(self):
+        """ Valeurs des lignes de check list enregistrees a la realisation des activites des dossiers
+        (les activites des autres modeles, CRM, factures..., n'alimentent pas la check list) """
+        now = fields.Datetime.now()
+        today = fields.Date.context_today(self)
+        return [{
+            'name': activity.activity_type_id.name,
+            'responsible_id': activity.user_id.name,
+            'activity_type_id': activity.activity_type_id.id,
+            'user_id': activity.user_id.id,
+            'date_start': activity.date_deadline,
+            'date_dealine': today,
+            'datetime_start': activity.create_date or now,
+            'datetime_done': now,
+            'folder_id': activity.model_transit_id.id,
+            'is_auto': bool(self.env.context.get('transit_checklist_auto')),
+        } for activity in self if activity.res_model == 'folder.transit']
+
+    def action_feedback_batch(self, feedback=False, attachment_ids=None):
+        """ Realise toutes les activites en une fois: les lignes de check list sont creees en un seul
+        appel et la progression n'est recalculee qu'une fois par dossier
+        :return (messages, activites suivantes)
+        """
+        if not self:
+            return self.env['mail.message'], self.browse()
+        checklists = self.env['task.checklist'].create(self._prepare_checklist_values())
+        checklists.folder_id.flush_recordset(['checklist_progress'])
+        return self.with_context(
             clean_context(self.env.context)
         )._action_done(feedback=feedback, attachment_ids=attachment_ids)
+
+    def action_feedback(self, feedback=False, attachment_ids=None):
+        messages, _next_activities = self.action_feedback_batch(feedback=feedback, attachment_ids=attachment_ids)
         return messages[0].id if messages else False
-       
+
 class TaskTransitChecklist(models.Model):
     _name = 'task.checklist'
     _description = 'Checklist for the task'
@@ -68,6 +109,12 @@ class TaskTransitChecklist(models.Model):
     date_dealine = fields.Date("Date Validation", required=True)
     date_start = fields.Date("Date Creation de la tache", required=True)
     folder_id = fields.Many2one("folder.transit", string="Dossier")
+    activity_type_id = fields.Many2one('mail.activity.type', string="Type d'activite", index=True)
+    user_id = fields.Many2one('res.users', string='Responsable', index=True)
+    datetime_start = fields.Datetime("Debut de la tache")
+    datetime_done = fields.Datetime("Fin de la tache")
+    is_auto = fields.Boolean("Realisee automatiquement", readonly=True,
+                             help="Tache creee et realisee a la creation du dossier: exclue des durees")
     
     time_spent_days = fields.Integer(
         string="Temps passé (jours)",
@@ -82,15 +129,69 @@ class TaskTransitChecklist(models.Model):
     
     state = fields.Selection([('transit', 'Dedouanement'), ('accone', 'Acconage'), ('ship', 'Shipping')], string='Type de dossier', related="folder_id.stages",store=True)
     
-    @api.depends('date_start', 'date_dealine')
+    @api.depends('date_start', 'date_dealine', 'datetime_start', 'datetime_done')
     def _compute_time_spent(self):
         for rec in self:
-            if rec.date_start and rec.date_dealine:
+            if rec.datetime_start and rec.datetime_done:
+                delta = rec.datetime_done - rec.datetime_start
+                rec.time_spent_days = delta.days
+                rec.time_spent_float = delta.total_seconds() / 3600.0
+            elif rec.date_start and rec.date_dealine:
                 delta = rec.date_dealine - rec.date_start
                 rec.time_spent_days = delta.days
-                rec.time_spent_float = delta.seconds
+                rec.time_spent_float = delta.days * 24.0
             else:
                 rec.time_spent_days = 0
                 rec.time_spent_float = 0.0
 
 
+class TaskChecklistDurationReport(models.Model):
+    _name = 'task.checklist.duration.report'
+    _description = 'Durees des taches par type, processus et responsable'
+    _auto = False
+    _order = 'duration_p90 desc'
+
+    activity_type_id = fields.Many2one('mail.activity.type', string="Type d'activite", readonly=True)
+    state = fields.Selection([('transit', 'Dedouanement'), ('accone', 'Acconage'), ('ship', 'Shipping')],
+                             string='Processus', readonly=True)
+    user_id = fields.Many2one('res.users', string='Responsable', readonly=True)
+    task_count = fields.Integer("Nombre de taches", readonly=True)
+    duration_avg = fields.Float("Duree moyenne (h)", readonly=True, group_operator='avg')
+    duration_p50 = fields.Float("Mediane (h)", readonly=True, group_operator='max')
+    duration_p90 = fields.Float("P90 (h)", readonly=True, group_operator='max')
+    duration_p95 = fields.Float("P95 (h)", readonly=True, group_operator='max')
+
+    def init(self):
+        """ Vue materialisee: les percentiles ne sont pas recalcules sur toute la check list a chaque
+        lecture mais a chaque rafraichissement (cron horaire, voir _refresh). Les taches realisees
+        automatiquement a la creation des dossiers (duree nulle) sont exclues. """
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE MATERIALIZED VIEW %s AS (
+                SELECT ROW_NUMBER() OVER (ORDER BY c.activity_type_id, c.state, c.user_id) AS id,
+                       c.activity_type_id,
+                       c.state,
+                       c.user_id,
+                       COUNT(*) AS task_count,
+                       AVG(c.time_spent_float) AS duration_avg,
+                       PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY c.time_spent_float) AS duration_p50,
+                       PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY c.time_spent_float) AS duration_p90,
+                       PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY c.time_spent_float) AS duration_p95
+                  FROM task_checklist c
+                 WHERE c.activity_type_id IS NOT NULL
+                   AND c.folder_id IS NOT NULL
+                   AND c.datetime_start IS NOT NULL
+                   AND c.datetime_done IS NOT NULL
+                   AND NOT COALESCE(c.is_auto, FALSE)
+              GROUP BY c.activity_type_id, c.state, c.user_id
+            )
+        """ % self._table)
+        # Index unique requis par REFRESH MATERIALIZED VIEW CONCURRENTLY
+        self.env.cr.execute("CREATE UNIQUE INDEX %s_id_index ON %s (id)" % (self._table, self._table))
+
+    @api.model
+    def _refresh(self):
+        """ Rafraichit la vue sans bloquer les lectures du rapport """
+        self.env['task.checklist'].flush_model()
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY %s" % self._table)
+        self.invalidate_model()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+from odoo.osv import expression
+
+# Modeles synchronises avec le client mobile des agents: (modele, champs envoyes)
+SYNC_MODELS = [
+    ('folder.transit', [
+        'name', 'stages', 'stage_id', 'customer_id', 'date_arrival', 'alerte', 'checklist_progress',
+        'num_ot', 'num_brd', 'num_di', 'num_manifeste', 'num_quittance', 'date_declaration',
+        'date_liquidation', 'date_quittance', 'date_bad', 'date_sortie', 'total_fcl20', 'total_fcl40',
+        'total_colis', 'user_id',
+    ]),
+    ('package.folders', [
+        'name', 'transit_id', 'package_type_id', 'container_valid', 'date_receipt', 'date_output',
+        'date_delivered', 'date_remove', 'date_return',
+    ]),
+    ('debour.transit', [
+        'transit_id', 'product_id', 'ref_deb', 'product_qty', 'amount_debour', 'price_taxed', 'billing_state',
+    ]),
+    ('task.checklist', [
+        'folder_id', 'name', 'responsible_id', 'description', 'activity_type_id', 'user_id', 'date_start',
+        'date_dealine', 'datetime_start', 'datetime_done',
+    ]),
+]
+
+# Recouvrement du filigrane (secondes): write_date vaut l'heure de debut de la transaction, une ecriture
+# validee apres la synchronisation peut donc porter une date anterieure au filigrane renvoye
+SYNC_OVERLAP_SECONDS = 120
+
+# Conservation des suppressions (jours), surchargeable par inov_transit.sync_tombstone_days.
+# Un client dont le filigrane est plus ancien recoit une synchronisation complete.
+SYNC_TOMBSTONE_DAYS = 90
+
+
+class TransitSyncTombstone(models.Model):
+    _name = 'transit.sync.tombstone'
+    _description = 'Suppressions a propager aux clients mobiles'
+    _order = 'id'
+
+    res_model = fields.Char("Modele", required=True, index=True)
+    res_id = fields.Integer("Enregistrement", required=True)
+    folder_ref = fields.Integer("Dossier", index=True)
+    user_id = fields.Many2one('res.users', string='Agent', ondelete='cascade',
+                              help="Renseigne quand le dossier sort seulement du perimetre de cet agent")
+    delete_date = fields.Datetime("Supprime le", required=True, default=fields.Datetime.now, index=True)
+
+    @api.model
+    def _record(self, vals_list):
+        if vals_list:
+            self.sudo().create(vals_list)
+
+    @api.model
+    def _cron_purge_tombstones(self):
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'inov_transit.sync_tombstone_days', SYNC_TOMBSTONE_DAYS))
+        self.sudo().search([('delete_date', '<', fields.Datetime.now() - timedelta(days=days))]).unlink()
+
+
+class TransitSyncMixin(models.AbstractModel):
+    _name = 'transit.sync.mixin'
+    _description = 'Suivi des suppressions pour la synchronisation mobile'
+
+    # Champ vers le dossier ('id' pour le dossier lui-meme)
+    _transit_sync_folder_field = 'id'
+
+    def init(self):
+        super(TransitSyncMixin, self).init()
+        if self._abstract:
+            return
+        # Parcours des modifications par dossier, dans l'ordre de write_date
+        column = self._transit_sync_folder_field
+        columns = ['write_date'] if column == 'id' else [column, 'write_date']
+        tools.create_index(self.env.cr, '%s_sync_write_date_index' % self._table, self._table, columns)
+
+    def unlink(self):
+        column = self._transit_sync_folder_field
+        tombstones = [{
+            'res_model': self._name,
+            'res_id': record.id,
+            'folder_ref': record.id if column == 'id' else record[column].id,
+        } for record in self]
+        result = super(TransitSyncMixin, self).unlink()
+        self.env['transit.sync.tombstone']._record(tombstones)
+        return result
+
+
+class TransitSyncFolder(models.Model):
+    _name = 'folder.transit'
+    _inherit = ['folder.transit', 'transit.sync.mixin']
+
+    def write(self, values):
+        """ Un dossier reattribue sort du perimetre de l'ancien agent: suppression pour lui seul """
+        previous = {}
+        if 'user_id' in values:
+            previous = {folder.id: folder.user_id.id for folder in self if folder.user_id.id != values['user_id']}
+        result = super(TransitSyncFolder, self).write(values)
+        self.env['transit.sync.tombstone']._record([{
+            'res_model': self._name,
+            'res_id': folder_id,
+            'folder_ref': folder_id,
+            'user_id': user_id,
+        } for folder_id, user_id in previous.items() if user_id])
+        return result
+
+    @api.model
+    def _sync_scope_exit(self, pairs):
+        """ Suppressions pour les agents qui perdent un dossier de leur perimetre: ni responsable du
+        dossier, ni aucune activite restante dessus
+        :param pairs: ensemble de (id dossier, id agent) a verifier apres l'operation
+        """
+        if not pairs:
+            return
+        folder_ids = list({folder_id for folder_id, _user_id in pairs})
+        user_ids = list({user_id for _folder_id, user_id in pairs})
+        self.env['mail.activity'].flush_model(['res_model', 'res_id', 'user_id'])
+        self.env.cr.execute("""
+            SELECT res_id, user_id
+              FROM mail_activity
+             WHERE res_model = 'folder.transit' AND res_id IN %s AND user_id IN %s
+        """, [tuple(folder_ids), tuple(user_ids)])
+        remaining = set(self.env.cr.fetchall())
+        owners = {folder.id: folder.user_id.id
+                  for folder in self.sudo().with_context(active_test=False).browse(folder_ids).exists()}
+        self.env['transit.sync.tombstone']._record([{
+            'res_model': self._name,
+            'res_id': folder_id,
+            'folder_ref': folder_id,
+            'user_id': user_id,
+        } for folder_id, user_id in pairs
+            if folder_id in owners and owners[folder_id] != user_id and (folder_id, user_id) not in remaining])
+
+    @api.model
+    def _sync_scope_domain(self):
+        """ Dossiers d'un agent: ceux qu'il traite et ceux ou il a une activite en cours """
+        return ['|', ('user_id', '=', self.env.uid), ('activity_user_id', '=', self.env.uid)]
+
+    @api.model
+    def _sync_changes(self, since=None, known_ids=None):
+        """ Modifications depuis le filigrane du client, limitees aux dossiers de l'agent.
+        :param since: filigrane renvoye par la synchronisation precedente (None: synchronisation complete)
+        :param known_ids: dossiers deja presents sur le client; les dossiers entrant dans le perimetre
+                          sont envoyes avec tous leurs enregistrements lies
+        :return dict compact: colonnes une seule fois par modele, lignes en listes, many2one en ids
+                et libelles regroupes dans 'names'
+        """
+        now = self.env.cr.now()
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'inov_transit.sync_tombstone_days', SYNC_TOMBSTONE_DAYS))
+        full_resync = not since or since < now - timedelta(days=days)
+        if full_resync:
+            since = None
+        known_ids = set(known_ids or ())
+
+        scope = self.search(self._sync_scope_domain())
+        scope_ids = set(scope.ids)
+        new_ids = scope_ids if since is None else scope_ids - known_ids
+        changes, deleted, names = {}, {}, {}
+
+        for model_name, fnames in SYNC_MODELS:
+            Model = self.env[model_name]
+            column = Model._transit_sync_folder_field
+            if since is None:
+                domain = [(column, 'in', list(scope_ids))]
+            else:
+                domain = expression.OR([
+                    [(column, 'in', list(scope_ids)), ('write_date', '>', since)],
+                    [(column, 'in', list(new_ids))],
+                ])
+            records = Model.search(domain, order='id') if scope_ids else Model
+            rows = records.read(fnames, load=None)
+            if rows:
+                changes[model_name] = {
+                    'fields': ['id'] + fnames,
+                    'rows': [[row['id']] + [row[fname] for fname in fnames] for row in rows],
+                }
+            for fname in fnames:
+                field = Model._fields[fname]
+                if field.type != 'many2one':
+                    continue
+                ids = {row[fname] for row in rows if row[fname]}
+                if ids:
+                    comodel = names.setdefault(field.comodel_name, {})
+                    comodel.update((rec.id, rec.display_name) for rec in self.env[field.comodel_name].browse(ids)
+                                   if rec.id not in comodel)
+
+        if since is not None:
+            # Dossiers archives (archivage froid) et enregistrements supprimes depuis le filigrane
+            archived_domain = [('active', '=', False), ('write_date', '>', since)]
+            if known_ids:
+                archived_domain.append(('id', 'in', list(known_ids)))
+            archived = self.with_context(active_test=False).search(
+                expression.AND([self._sync_scope_domain(), archived_domain]))
+            if archived:
+                deleted.setdefault(self._name, set()).update(archived.ids)
+            tombstones = self.env['transit.sync.tombstone'].sudo().search([
+                ('delete_date', '>', since),
+                '|', ('user_id', '=', self.env.uid),
+                '&', ('user_id', '=', False), ('folder_ref', 'in', list(scope_ids | known_ids)),
+            ])
+            for tombstone in tombstones:
+                deleted.setdefault(tombstone.res_model, set()).add(tombstone.res_id)
+            if self._name in deleted:
+                # Dossier reattribue mais toujours suivi par l'agent au travers d'une activite
+                deleted[self._name] -= scope_ids
+
+        return {
+            'watermark': fields.Datetime.to_string(now - timedelta(seconds=SYNC_OVERLAP_SECONDS)),
+            'full_resync': full_resync,
+            'changes': changes,
+            'deleted': {model_name: sorted(ids) for model_name, ids in deleted.items()},
+            'names': names,
+        }
+
+
+class TransitSyncPackage(models.Model):
+    _name = 'package.folders'
+    _inherit = ['package.folders', 'transit.sync.mixin']
+    _transit_sync_folder_field = 'transit_id'
+
+
+class TransitSyncDebour(models.Model):
+    _name = 'debour.transit'
+    _inherit = ['debour.transit', 'transit.sync.mixin']
+    _transit_sync_folder_field = 'transit_id'
+
+
+class TransitSyncChecklist(models.Model):
+    _name = 'task.checklist'
+    _inherit = ['task.checklist', 'transit.sync.mixin']
+    _transit_sync_folder_field = 'folder_id'
+
+
+class TransitSyncActivity(models.Model):
+    _inherit = 'mail.activity'
+
+    def _sync_scope_pairs(self):
+        return {(activity.res_id, activity.user_id.id) for activity in self
+                if activity.res_model == 'folder.transit' and activity.res_id and activity.user_id}
+
+    def write(self, values):
+        """ Activite reattribuee: le dossier peut sortir du perimetre de l'ancien responsable """
+        pairs = self._sync_scope_pairs() if 'user_id' in values else set()
+        result = super(TransitSyncActivity, self).write(values)
+        self.env['folder.transit']._sync_scope_exit(pairs)
+        return result
+
+    def unlink(self):
+        """ Activite realisee ou supprimee: idem """
+        pairs = self._sync_scope_pairs()
+        result = super(TransitSyncActivity, self).unlink()
+        self.env['folder.transit']._sync_scope_exit(pairs)
+        return result
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import test_any_reference
+from . import test_activity_plan
+from . import test_amount_transit
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestActivityPlan(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestActivityPlan, cls).setUpClass()
+        cls.alertes = (cls.env.ref('inov_transit.mail_activity_alerte_danger')
+                       | cls.env.ref('inov_transit.mail_activity_alerte_overdue'))
+        cls.plan = cls.env['mail.activity.type'].browse(
+            cls.env['folder.transit']._get_activity_plans().get('transit', ()))
+
+    def _check_done(self, folder, activity_types):
+        today = fields.Date.today()
+        self.env['task.checklist'].create([{
+            'folder_id': folder.id,
+            'name': activity_type.name,
+            'activity_type_id': activity_type.id,
+            'date_start': today,
+            'date_dealine': today,
+        } for activity_type in activity_types])
+
+    def test_transit_plan_excludes_alertes(self):
+        self.assertTrue(self.plan)
+        self.assertFalse(self.plan & self.alertes)
+
+    def test_transit_plan_final_step(self):
+        """ Apres la derniere etape du plan, aucune activite n'est planifiee (en particulier pas d'alerte ETA) """
+        folder = self.env['folder.transit'].create({'stages': 'transit'})
+        folder.activity_ids.unlink()
+        self._check_done(folder, self.plan[:-1])
+        self.assertEqual(folder._get_next_activity_type(self.plan), self.plan[-1])
+
+        self._check_done(folder, self.plan[-1])
+        self.assertFalse(folder._get_next_activity_type(self.plan))
+        folder.activity_scheduler()
+        self.assertFalse(folder.activity_ids)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAmountTransit(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super(TestAmountTransit, cls).setUpClass(chart_template_ref=chart_template_ref)
+        # Prestation sans type de service: charge variable dans les deux calculs
+        cls.env['prestation.transit'].create({'product_id': cls.product_a.id, 'type_service': False, 'taux': 10.0})
+
+    def test_amount_transit_form_matches_stored(self):
+        """ Le calcul du formulaire (facture non enregistree) et le calcul groupe des factures enregistrees
+        classent de la meme maniere une ligne dont la prestation n'a pas de type de service """
+        vals = {
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': '2026-01-01',
+            'invoice_line_ids': [
+                (0, 0, {'product_id': self.product_a.id, 'quantity': 2, 'price_unit': 1000.0}),
+                (0, 0, {'product_id': self.product_b.id, 'quantity': 1, 'price_unit': 500.0}),
+            ],
+        }
+        draft = self.env['account.move'].new(vals)
+        invoice = self.env['account.move'].create(vals)
+
+        variable_line = invoice.invoice_line_ids.filtered(lambda line: line.product_id == self.product_a)
+        self.assertTrue(variable_line.price_total)
+        self.assertEqual(invoice.amount_transit_expense_variable, variable_line.price_total)
+        for fname in ('amount_transit_debours', 'amount_transit_expense', 'amount_transit_expense_variable'):
+            self.assertEqual(draft[fname], invoice[fname], fname)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import SQL
+
+
+@tagged('post_install', '-at_install')
+class TestAnyReference(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestAnyReference, cls).setUpClass()
+        cls.folder = cls.env['folder.transit'].create({'stages': 'ship', 'num_ot': 'OT-TRGM-0042'})
+        cls.other = cls.env['folder.transit'].create({'stages': 'ship', 'num_ot': 'OT-TRGM-0043'})
+        cls.env['package.folders'].create({'name': 'MSKU1234565', 'transit_id': cls.folder.id})
+
+    def test_any_reference_matches(self):
+        Folder = self.env['folder.transit']
+        self.assertEqual(Folder.search([('any_reference', 'ilike', 'trgm-0042')]), self.folder)
+        self.assertEqual(Folder.search([('any_reference', 'ilike', 'msku1234')]), self.folder)
+        folders = self.folder | self.other
+        self.assertEqual(Folder.search([('any_reference', 'not ilike', 'msku1234'), ('id', 'in', folders.ids)]),
+                         self.other)
+
+    def test_any_reference_uses_trigram_indexes(self):
+        """ La recherche ne doit pas parcourir folder_transit: un BitmapOr sur les index trigrammes """
+        if not self.registry.has_trigram:
+            self.skipTest("Extension pg_trgm indisponible")
+        query = self.env['folder.transit']._search([('any_reference', 'ilike', 'msku1234')])
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.env.cr.execute(SQL("EXPLAIN %s", query.select()))
+        plan = "\n".join(row[0] for row in self.env.cr.fetchall())
+        self.assertIn("BitmapOr", plan)
+        self.assertNotIn("Seq Scan on folder_transit", plan)
+        self.assertNotIn("SubPlan", plan)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de performance de la conversion des montants en lettres (models/conversion.py).
+
+Usage:
+    python conversion_benchmark.py
+
+Compare la conversion actuelle a l'implementation precedente (tables globales reaffectees a chaque
+appel), recopiee ci-dessous, sur 20000 montants aleatoires et signale les ecarts de resultat.
+Le module est charge par son chemin: ni Odoo ni l'addon ne sont importes.
+"""
+
+import importlib.util
+import os
+import random
+import timeit
+
+CONVERSION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'models', 'conversion.py')
+
+spec = importlib.util.spec_from_file_location('conversion', CONVERSION_PATH)
+conversion = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(conversion)
+UNITS, TENS = conversion.UNITS, conversion.TENS
+trad, batch_amount_to_words = conversion.trad, conversion.batch_amount_to_words
+
+
+def legacy_tradd(num):
+    global t1, t2
+    ch = ''
+    if num == 0:
+        ch = ''
+    elif num < 20:
+        ch = t1[num]
+    elif num >= 20:
+        if (num >= 70 and num <= 79) or (num >= 90):
+            z = int(num / 10) - 1
+        else:
+            z = int(num / 10)
+        ch = t2[z]
+        num = num - z * 10
+        if (num == 1 or num == 11) and z < 8:
+            ch = ch + ' et'
+        if num > 0:
+            ch = ch + ' ' + legacy_tradd(num)
+        else:
+            ch = ch + legacy_tradd(num)
+    return ch
+
+def legacy_tradn(num):
+    global t1, t2
+    ch = ''
+    flagcent = False
+    if num >= 1000000000:
+        z = int(num / 1000000000)
+        ch = ch + legacy_tradn(z) + ' milliard'
+        if z > 1:
+            ch = ch + 's'
+        num = num - z * 1000000000
+    if num >= 1000000:
+        z = int(num / 1000000)
+        ch = ch + legacy_tradn(z) + ' million'
+        if z > 1:
+            ch = ch + 's'
+        num = num - z * 1000000
+    if num >= 1000:
+        if num >= 100000:
+            z = int(num / 100000)
+            if z > 1:
+                ch = ch + ' ' + legacy_tradd(z)
+            ch = ch + ' cent'
+            flagcent = True
+            num = num - z * 100000
+            if int(num / 1000) == 0 and z > 1:
+                ch = ch + 's'
+        if num >= 1000:
+            z = int(num / 1000)
+            if (z == 1 and flagcent) or z > 1:
+                ch = ch + ' ' + legacy_tradd(z)
+            num = num - z * 1000
+        ch = ch + ' mille'
+    if num >= 100:
+        z = int(num / 100)
+        if z > 1:
+            ch = ch + ' ' + legacy_tradd(z)
+        ch = ch + " cent"
+        num = num - z * 100
+    if num > 0:
+        ch = ch + " " + legacy_tradd(num)
+    return ch
+
+def legacy_trad(nb, unite="DirHam", decim="centime"):
+    global t1, t2
+    nb = round(nb, 2)
+    t1 = list(UNITS)
+    t2 = list(TENS)
+    z1 = int(nb)
+    z3 = (nb - z1) * 100
+    z2 = int(round(z3, 0))
+    if z1 == 0:
+        ch = "zéro"
+    else:
+        ch = legacy_tradn(abs(z1))
+    if z1 > 1 or z1 < -1:
+        if unite != '':
+            ch = ch + " " + unite
+    else:
+        ch = ch + " " + unite
+    if z2 > 0:
+        ch = ch + legacy_tradn(z2)
+        if z2 > 1 or z2 < -1:
+            if decim != '':
+                ch = ch + " " + decim
+        else:
+            ch = ch + " " + decim
+    if nb < 0:
+        ch = "moins " + ch
+    return ch
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    amounts = [round(random.uniform(0, 50000000), random.choice([0, 2])) for _i in range(20000)]
+    mismatches = [a for a in amounts if trad(a, 'FCFA') != legacy_trad(a, 'FCFA')]
+    print('')
+    print('Benchmark (%s montants, %s ecart(s) avec l\'ancienne implementation) :' % (len(amounts), len(mismatches)))
+    print('--------  ')
+    for label, func in (('ancienne trad', lambda: [legacy_trad(a, 'FCFA') for a in amounts]),
+                        ('trad', lambda: [trad(a, 'FCFA') for a in amounts]),
+                        ('batch_amount_to_words', lambda: batch_amount_to_words(amounts))):
+        duration = min(timeit.repeat(func, number=1, repeat=5))
+        print('%-22s %10.0f montants/s' % (label, len(amounts) / duration))
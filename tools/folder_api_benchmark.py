@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de charge de l'API /inov_transit/api/folders contre un serveur local.
+
+Usage:
+    python folder_api_benchmark.py --url http://localhost:8069 --db transit --login admin --password admin \
+        --threads 8 --requests 200 --query "process=transit&limit=100"
+
+Chaque worker rejoue la meme requete: la premiere reponse (200) fournit l'ETag, les suivantes sont
+conditionnelles (If-None-Match) et doivent revenir en 304 tant que les dossiers ne changent pas.
+Un passage sans ETag sert de reference. Seule la bibliotheque standard est utilisee.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def authenticate(url, db, login, password):
+    """ Ouvre une session et renvoie le cookie session_id """
+    payload = json.dumps({
+        'jsonrpc': '2.0', 'method': 'call',
+        'params': {'db': db, 'login': login, 'password': password},
+    }).encode()
+    req = urllib.request.Request(url + '/web/session/authenticate', data=payload,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as response:
+        result = json.loads(response.read())
+        if result.get('error'):
+            raise SystemExit("Authentification refusee: %s" % result['error'].get('message'))
+        for header in response.headers.get_all('Set-Cookie') or []:
+            if header.startswith('session_id='):
+                return header.split(';', 1)[0]
+    raise SystemExit("Pas de cookie de session renvoye par le serveur")
+
+
+def fetch(endpoint, cookie, etag=None):
+    headers = {'Cookie': cookie}
+    if etag:
+        headers['If-None-Match'] = etag
+    req = urllib.request.Request(endpoint, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as response:
+            body = response.read()
+            status, new_etag = response.status, response.headers.get('ETag')
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        body, status, new_etag = b'', 304, e.headers.get('ETag')
+    return status, new_etag or etag, len(body), time.perf_counter() - start
+
+
+def run(endpoint, cookie, threads, requests, conditional):
+    durations, statuses, sizes = [], {}, []
+    lock = threading.Lock()
+
+    def worker():
+        etag = None
+        for _i in range(requests):
+            status, new_etag, size, duration = fetch(endpoint, cookie, etag if conditional else None)
+            etag = new_etag
+            with lock:
+                durations.append(duration)
+                statuses[status] = statuses.get(status, 0) + 1
+                sizes.append(size)
+
+    workers = [threading.Thread(target=worker) for _i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    durations.sort()
+    return {
+        'rps': len(durations) / elapsed,
+        'p50': statistics.median(durations) * 1000,
+        'p95': durations[int(len(durations) * 0.95) - 1] * 1000,
+        'statuses': statuses,
+        'avg_size': sum(sizes) / len(sizes),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="requetes par worker")
+    parser.add_argument('--query', default='limit=100')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    session = authenticate(url, args.db, args.login, args.password)
+    endpoint = '%s/inov_transit/api/folders?%s' % (url, args.query)
+    print('Banc de charge %s (%s workers x %s requetes)' % (endpoint, args.threads, args.requests))
+    print('--------  ')
+    for label, conditional in (('sans ETag', False), ('If-None-Match', True)):
+        stats = run(endpoint, session, args.threads, args.requests, conditional)
+        print('%-14s %8.1f req/s  p50 %7.1f ms  p95 %7.1f ms  %8.0f octets/rep  %s' % (
+            label, stats['rps'], stats['p50'], stats['p95'], stats['avg_size'], stats['statuses']))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de performance de la validation des numeros de conteneurs ISO 6346 (models/iso6346.py).
+
+Usage:
+    python iso6346_benchmark.py
+
+Affiche quelques exemples de normalisation et d'extraction, puis le debit de validate_batch sur
+50000 numeros aleatoires. Le module est charge par son chemin: ni Odoo ni l'addon ne sont importes.
+"""
+
+import importlib.util
+import os
+import random
+import string
+import timeit
+
+ISO6346_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'models', 'iso6346.py')
+
+spec = importlib.util.spec_from_file_location('iso6346', ISO6346_PATH)
+iso6346 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(iso6346)
+normalize, is_valid, check_digit = iso6346.normalize, iso6346.is_valid, iso6346.check_digit
+extract, validate_batch = iso6346.extract, iso6346.validate_batch
+
+
+if __name__ == '__main__':
+    print('')
+    print('Exemples :')
+    print('--------  ')
+    for sample in ('CSQU3054383', 'csqu 305438-3', 'MSCU1234565', 'MSKU907032-3', 'ABCD1234567'):
+        print('%-15s %-12s %s' % (sample, normalize(sample), is_valid(normalize(sample))))
+    print(extract('BL 123 / conteneurs: CSQU 305438 3, MSKU9070323 (40HC)'))
+
+    random.seed(0)
+    numbers = []
+    for _i in range(50000):
+        code = ''.join(random.choice(string.ascii_uppercase) for _j in range(3)) + 'U' + \
+            ''.join(random.choice(string.digits) for _j in range(6))
+        numbers.append(code + str(check_digit(code)))
+    duration = min(timeit.repeat(lambda: validate_batch(numbers), number=1, repeat=5))
+    print('')
+    print('validate_batch: %.0f numeros/s' % (len(numbers) / duration))
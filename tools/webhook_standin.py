@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Destinataire HTTP local pour tester l'envoi des evenements des dossiers (folder.transit.outbox).
+
+Usage:
+    python webhook_standin.py --port 8099 --fail-rate 0.3 --delay 0.2
+
+puis declarer un destinataire "Webhook HTTP" sur http://localhost:8099/hook. Chaque lot recu est
+controle: evenements en double (nouvelles tentatives) et evenements d'un meme dossier recus dans le
+desordre sont comptes et affiches. --fail-rate et --delay simulent un destinataire instable ou lent
+pour observer les nouvelles tentatives et les metriques de contre-pression.
+Seule la bibliotheque standard est utilisee.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandinState:
+
+    def __init__(self, output=None):
+        self.lock = threading.Lock()
+        self.last_by_folder = {}
+        self.seen = set()
+        self.counters = {'batches': 0, 'events': 0, 'duplicates': 0, 'out_of_order': 0, 'rejected': 0}
+        self.output = output
+
+    def record(self, events):
+        with self.lock:
+            self.counters['batches'] += 1
+            for event in events:
+                self.counters['events'] += 1
+                if event['id'] in self.seen:
+                    self.counters['duplicates'] += 1
+                    continue
+                self.seen.add(event['id'])
+                folder_id = event.get('folder_id')
+                if folder_id and self.last_by_folder.get(folder_id, 0) > event['id']:
+                    self.counters['out_of_order'] += 1
+                    print("Desordre: dossier %s, evenement %s recu apres %s" % (
+                        folder_id, event['id'], self.last_by_folder[folder_id]))
+                self.last_by_folder[folder_id] = max(self.last_by_folder.get(folder_id, 0), event['id'])
+                if self.output:
+                    self.output.write(json.dumps(event) + '\n')
+            if self.output:
+                self.output.flush()
+            return dict(self.counters)
+
+
+def make_handler(state, fail_rate, delay, status):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if delay:
+                time.sleep(delay)
+            if random.random() < fail_rate:
+                with state.lock:
+                    state.counters['rejected'] += 1
+                self.send_response(status)
+                self.end_headers()
+                return
+            events = json.loads(body or b'{}').get('events', [])
+            counters = state.record(events)
+            print("Lot de %s evenement(s) - %s" % (len(events), counters))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"ok": true}')
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="part des lots refuses (0 a 1)")
+    parser.add_argument('--status', type=int, default=503, help="code HTTP renvoye pour un lot refuse")
+    parser.add_argument('--delay', type=float, default=0.0, help="latence simulee par lot (secondes)")
+    parser.add_argument('--output', help="fichier JSON lines des evenements acceptes")
+    args = parser.parse_args()
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else None
+    standin = StandinState(output)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(standin, args.fail_rate, args.delay, args.status))
+    print("Destinataire de test sur http://%s:%s/hook" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(standin.counters)
+    finally:
+        if output:
+            output.close()
@@ -2,4 +2,6 @@
 
 
 from . import debour_transit_wizard
-from . import message_wizard
\ No newline at end of file
+from . import folder_invoice_wizard
+from . import message_wizard
+from . import package_import_wizard
\ No newline at end of file
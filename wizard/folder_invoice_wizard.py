@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+
+class FolderInvoiceWizard(models.TransientModel):
+    _name = 'folder.invoice.wizard'
+    _description = 'Facturation groupee des dossiers'
+
+    @api.model
+    def _default_folder_ids(self):
+        if self.env.context.get('active_model') == 'folder.transit':
+            return [(6, 0, self.env.context.get('active_ids', []))]
+        return []
+
+    folder_ids = fields.Many2many('folder.transit', string='Dossiers', default=_default_folder_ids)
+
+    def action_create_invoices(self):
+        self.ensure_one()
+        if not self.folder_ids:
+            raise UserError(_('Veuillez selectionner au moins un dossier.'))
+        invoices = self.folder_ids._create_invoices()
+        action = self.env["ir.actions.actions"]._for_xml_id("inov_transit.action_invoice_transit_tree")
+        action['domain'] = [('id', 'in', invoices.ids)]
+        if len(invoices) == 1:
+            action['views'] = [(False, 'form')]
+            action['res_id'] = invoices.id
+        return action
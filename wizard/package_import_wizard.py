@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import binascii
+import io
+import re
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from ..models import iso6346
+
+# Nombre de conteneurs controles et crees par lot pendant la lecture du manifeste
+IMPORT_BATCH_SIZE = 1000
+
+# Code taille/type ISO (22G1, 45R1...): le premier chiffre donne la longueur du conteneur
+SIZE_TYPE_RE = re.compile(r'\b([24])[0-9A-Z][A-Z][0-9]\b')
+SIZE_TYPE_XMLIDS = {
+    '2': 'inov_transit.package_20',
+    '4': 'inov_transit.package_40',
+}
+
+
+class PackageImportWizard(models.TransientModel):
+    _name = 'package.import.wizard'
+    _description = 'Import des conteneurs depuis un manifeste'
+
+    @api.model
+    def _default_transit_id(self):
+        if self.env.context.get('active_model') == 'folder.transit':
+            return self.env.context.get('active_id')
+        return False
+
+    transit_id = fields.Many2one('folder.transit', string='Dossier', required=True, default=_default_transit_id)
+    file = fields.Binary("Manifeste", required=True, attachment=False)
+    filename = fields.Char("Nom du fichier")
+    package_type_id = fields.Many2one('package.transit', string='Type par defaut',
+                                      help="Type utilise quand le manifeste ne donne pas de code taille/type ISO")
+    state = fields.Selection([('draft', 'Brouillon'), ('done', 'Termine')], default='draft')
+    created_count = fields.Integer("Conteneurs crees", readonly=True)
+    duplicate_count = fields.Integer("Doublons (autres dossiers actifs)", readonly=True)
+    invalid_count = fields.Integer("Numeros invalides", readonly=True)
+    result = fields.Text("Compte rendu", readonly=True)
+
+    def _iter_manifest_lines(self):
+        """ Lit le manifeste ligne par ligne sans le charger en texte complet """
+        try:
+            content = base64.b64decode(self.file)
+        except (binascii.Error, TypeError):
+            raise UserError(_("Le fichier du manifeste est illisible."))
+        with io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig', errors='replace') as stream:
+            for line in stream:
+                yield line
+
+    def _iter_manifest_containers(self):
+        """ (numero normalise, code longueur ISO ou False) de chaque conteneur du manifeste """
+        for line in self._iter_manifest_lines():
+            numbers = iso6346.extract(line)
+            if not numbers:
+                continue
+            size_type = SIZE_TYPE_RE.search(line.upper())
+            for number in numbers:
+                yield number, size_type and size_type.group(1)
+
+    def _flush_batch(self, batch, seen, type_ids, stats):
+        """ Controle puis cree en une fois un lot de conteneurs """
+        Package = self.env['package.folders']
+        validation = iso6346.validate_batch([number for number, _size in batch])
+        valid = []
+        for number, size in batch:
+            if number in seen:
+                continue
+            seen.add(number)
+            if not validation[number][1]:
+                stats['invalid'].append(number)
+                continue
+            valid.append((number, size))
+        if not valid:
+            return
+        duplicates = Package._get_active_duplicates([number for number, _size in valid])
+        vals_list = []
+        for number, size in valid:
+            folder_ids = [folder_id for folder_id in duplicates.get(number, []) if folder_id != self.transit_id.id]
+            if len(folder_ids) < len(duplicates.get(number, [])):
+                # Conteneur deja present sur ce dossier: reimport sans effet
+                continue
+            if folder_ids:
+                stats['duplicates'].append(number)
+            vals_list.append({
+                'name': number,
+                'transit_id': self.transit_id.id,
+                'package_type_id': type_ids.get(size) or self.package_type_id.id,
+            })
+        Package.create(vals_list)
+        stats['created'] += len(vals_list)
+
+    def action_import(self):
+        self.ensure_one()
+        if not self.file:
+            raise UserError(_("Veuillez joindre le manifeste."))
+        type_ids = {}
+        for size, xmlid in SIZE_TYPE_XMLIDS.items():
+            package_type = self.env.ref(xmlid, raise_if_not_found=False)
+            type_ids[size] = package_type.id if package_type else False
+        stats = {'created': 0, 'duplicates': [], 'invalid': []}
+        seen = set()
+        batch = []
+        for container in self._iter_manifest_containers():
+            batch.append(container)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self._flush_batch(batch, seen, type_ids, stats)
+                batch = []
+        if batch:
+            self._flush_batch(batch, seen, type_ids, stats)
+
+        lines = [_("%s conteneur(s) importe(s) depuis %s.") % (stats['created'], self.filename or _('le manifeste'))]
+        if stats['duplicates']:
+            lines.append(_("Deja presents sur un autre dossier actif: %s") % ', '.join(stats['duplicates']))
+        if stats['invalid']:
+            lines.append(_("Cle ISO 6346 invalide (non importes): %s") % ', '.join(stats['invalid']))
+        result = '\n'.join(lines)
+        self.transit_id.message_post(body=result)
+        self.write({
+            'state': 'done',
+            'created_count': stats['created'],
+            'duplicate_count': len(stats['duplicates']),
+            'invalid_count': len(stats['invalid']),
+            'result': result,
+            'file': False,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }